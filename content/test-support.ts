@@ -41,6 +41,16 @@ export class TestSupport {
     return (AutoExport.db.find($and({ status: 'running' })).length > 0)
   }
 
+  public async autoExportIdle(timeout: number): Promise<boolean> {
+    // long-poll so the test driver doesn't have to ask over and over
+    const deadline = Date.now() + timeout
+    while (this.autoExportRunning()) {
+      if (Date.now() >= deadline) return false
+      await Zotero.Promise.delay(100) // eslint-disable-line no-magic-numbers
+    }
+    return true
+  }
+
   public async reset(scenario: string): Promise<void> {
     log.debug('reset for', scenario)
 
@@ -129,7 +139,7 @@ export class TestSupport {
     return await Translators.exportItems(translatorID, displayOptions, scope, path)
   }
 
-  public async select(ids: number[]): Promise<boolean> {
+  public async select(ids: number[], settle = 0): Promise<boolean> {
     const zoteroPane = Zotero.getActiveZoteroPane()
     // zoteroPane.show()
 
@@ -147,11 +157,35 @@ export class TestSupport {
         selected = []
       }
 
-      if (sortedIDs === JSON.stringify(selected.sort())) return true
+      if (sortedIDs === JSON.stringify(selected.sort())) {
+        if (settle) await this.settled(zoteroPane, sortedIDs, settle)
+        return true
+      }
     }
     throw new Error(`failed to select ${ids}`)
   }
 
+  private async settled(zoteroPane: any, sortedIDs: string, msecs: number): Promise<void> {
+    // the item tree and item pane update asynchronously after a selection; wait until the selection has held for `msecs`
+    const interval = 50
+    const deadline = Date.now() + 10000 // eslint-disable-line no-magic-numbers
+    let held = 0
+    while (held < msecs) {
+      if (Date.now() > deadline) throw new Error(`selection of ${sortedIDs} did not settle`)
+      if (zoteroPane.itemsView?.waitForLoad) await zoteroPane.itemsView.waitForLoad()
+      await Zotero.Promise.delay(interval)
+
+      let selected
+      try {
+        selected = zoteroPane.getSelectedItems(true)
+      }
+      catch (err) {
+        selected = []
+      }
+      held = sortedIDs === JSON.stringify(selected.sort()) ? held + interval : 0
+    }
+  }
+
   public async find(query: { contains: string, is: string }, expected = 1): Promise<number[]> {
     if (!Object.keys(query).length) throw new Error(`empty query ${JSON.stringify(query)}`)
 
@@ -236,6 +270,22 @@ export class TestSupport {
     Cache.reset('requested during test')
   }
 
+  public async cacheState(translatorID: string, displayOptions: Record<string, number | string | boolean>): Promise<{ items: number, cached: number | null }> {
+    const items = (await Zotero.Items.getAll(Zotero.Libraries.userLibraryID, true, false, false)).filter(item => item.isRegularItem()).length
+    // Translators.uncached reports nothing uncached when there is no cache at all, which must not pass for a full cache
+    if (!Preference.cache || !Cache.getCollection(Translators.byId[translatorID].label)) return { items, cached: null }
+    const uncached = (await Translators.uncached(translatorID, displayOptions, { library: Zotero.Libraries.userLibraryID })).length
+    return { items, cached: items - uncached }
+  }
+
+  public async invalidateCache(fraction: number): Promise<number> {
+    const items = (await Zotero.Items.getAll(Zotero.Libraries.userLibraryID, true, false, false)).filter(item => item.isRegularItem())
+    const every = fraction > 0 ? Math.max(Math.round(1 / fraction), 1) : 0
+    const invalidated = every ? items.filter((_item, i) => i % every === 0).map(item => item.id) : []
+    Cache.remove(invalidated, 'partial invalidation requested during test')
+    return invalidated.length
+  }
+
   public async merge(ids: number[]): Promise<void> {
     const zoteroPane = Zotero.getActiveZoteroPane()
     await zoteroPane.selectItems(ids, true)
@@ -0,0 +1,15 @@
+@benchmark
+Feature: Benchmark
+
+  # only runs with --benchmark record/check
+  @not.with_benchmark=false @use.with_client=zotero @timeout=3000
+  Scenario Outline: Cache use for <translator>
+    When I import 1241 references from "export/Bulk performance test.json"
+    Then I benchmark the cache for "<translator>" cold, warm and with 10% invalidated
+
+    Examples:
+      | translator      |
+      | Better BibTeX   |
+      | Better BibLaTeX |
+      | Better CSL JSON |
+      | Better CSL YAML |
@@ -0,0 +1,141 @@
+import heapq
+import re
+import time
+import zlib
+from munch import Munch
+from behave.model import ScenarioOutline
+import steps.utils as utils
+
+def scenario_name(name):
+  # strip the example marker from outline scenarios
+  return re.sub(r' -- @[0-9]+\.[0-9]+ ', '', name)
+
+def msecs(duration):
+  if type(duration) in (float, int): return duration
+  return duration['msecs']
+
+def partition(durations, bins, rounds=1000):
+  # longest-processing-time-first greedy
+  loads = [0] * bins
+  members = [[] for _ in range(bins)]
+  heap = [(0, b) for b in range(bins)]
+  for name, duration in sorted(durations.items(), key=lambda test: (-test[1], test[0])):
+    load, b = heapq.heappop(heap)
+    members[b].append(name)
+    loads[b] = load + duration
+    heapq.heappush(heap, (loads[b], b))
+
+  # local search: move or swap single tests between the fullest and emptiest bin while that lowers the larger of the two
+  for _ in range(rounds):
+    hi = max(range(bins), key=lambda b: loads[b])
+    lo = min(range(bins), key=lambda b: loads[b])
+    gap = loads[hi] - loads[lo]
+    if gap == 0: break
+
+    best = None
+    for i, a in enumerate(members[hi]):
+      # moving a test of duration d out of hi improves things when 0 < d < gap
+      delta = durations[a]
+      if 0 < delta < gap and (best is None or abs(gap - 2 * delta) < best[0]):
+        best = (abs(gap - 2 * delta), i, None, delta)
+      for j, b in enumerate(members[lo]):
+        delta = durations[a] - durations[b]
+        if 0 < delta < gap and (best is None or abs(gap - 2 * delta) < best[0]):
+          best = (abs(gap - 2 * delta), i, j, delta)
+    if best is None: break
+
+    _, i, j, delta = best
+    a = members[hi].pop(i)
+    members[lo].append(a)
+    if j is not None:
+      members[hi].append(members[lo].pop(j))
+    loads[hi] -= delta
+    loads[lo] += delta
+
+  return [sorted(names) for names in members]
+
+def parse_bin(value, default):
+  # `bin` is either `i` or `i/K`, 1-based
+  if '/' in value:
+    i, bins = value.split('/')
+    return int(i) - 1, int(bins)
+  return int(value) - 1, default
+
+def arrange(items, cost, mode):
+  # in place: behave holds on to these lists
+  items.sort(key=lambda item: -cost(item))
+  if mode == 'interleave':
+    longest, shortest = items[:(len(items) + 1) // 2], items[(len(items) + 1) // 2:][::-1]
+    items[:] = [item for pair in zip(longest, shortest + [None]) for item in pair if item is not None]
+
+def hms(msecs):
+  secs = int(msecs / 1000)
+  return f'{secs // 3600}:{(secs // 60) % 60:02d}:{secs % 60:02d}'
+
+class Balance:
+  def __init__(self, balance, slow, bin=None):
+    recorded = balance['slow' if slow else 'fast']
+    self.durations = { name: msecs(balance['duration'][name]) for names in recorded for name in names if name in balance['duration'] }
+    # unknown tests are assumed to take as long as the median known test
+    self.default = sorted(self.durations.values())[len(self.durations) // 2] if self.durations else 0
+    self.started = time.time()
+    self.ran = Munch(n=0, msecs=0, predicted=0)
+
+    if bin is None:
+      self.bin, self.bins = 0, 1
+      self.assignment = {}
+      return
+
+    self.bin, self.bins = parse_bin(bin, len(recorded))
+    assert 0 <= self.bin < self.bins, f'bin {bin} out of range'
+
+    if len(recorded) == self.bins:
+      self.assignment = { name: b for b, names in enumerate(recorded) for name in names }
+    else:
+      # run with a different number of bins than recorded: repartition on the recorded durations
+      self.assignment = { name: b for b, names in enumerate(partition({ name: self.durations.get(name, 0) for names in recorded for name in names }, self.bins)) for name in names }
+
+  def bin_of(self, name):
+    if self.bins == 1: return 0
+    name = scenario_name(name)
+    if name in self.assignment: return self.assignment[name]
+    # new tests are spread deterministically so every job agrees on where they run
+    return zlib.crc32(name.encode('utf-8')) % self.bins
+
+  def skip(self, name):
+    b = self.bin_of(name)
+    return None if b == self.bin else str(b + 1)
+
+  def predict(self, name):
+    return self.durations.get(scenario_name(name), self.default)
+
+  def plan(self, features, mode=None, runs=lambda scenario: True):
+    def cost(item):
+      scenarios = item.walk_scenarios() if hasattr(item, 'walk_scenarios') else getattr(item, 'scenarios', [item])
+      return sum(self.predict(scenario.name) for scenario in scenarios if self.bin_of(scenario.name) == self.bin and runs(scenario))
+
+    predicted = [0] * self.bins
+    for feature in features:
+      for scenario in feature.walk_scenarios():
+        if runs(scenario): predicted[self.bin_of(scenario.name)] += self.predict(scenario.name)
+    # only worth reporting when the suite is actually split
+    for b, total in enumerate(predicted if self.bins > 1 else []):
+      utils.print(f'bin {b + 1}/{self.bins}: predicted finish after {hms(total)}' + (' <=' if b == self.bin else ''))
+    self.ran.predicted = predicted[self.bin]
+
+    if mode is None: return
+    assert mode in ['longest', 'interleave'], f'unsupported scenario order {mode}'
+    arrange(features, cost, mode)
+    for feature in features:
+      for items in [getattr(feature, 'run_items', None), feature.scenarios]:
+        if type(items) == list: arrange(items, cost, mode)
+      for outline in feature.scenarios:
+        if isinstance(outline, ScenarioOutline): arrange(outline.scenarios, cost, mode)
+
+  def done(self, scenario):
+    self.ran.n += 1
+    self.ran.msecs += scenario.duration * 1000
+
+  def report(self):
+    if self.bins == 1: return
+    utils.print(f'bin {self.bin + 1}/{self.bins}: predicted {hms(self.ran.predicted)}, ran {self.ran.n} scenarios in {hms(self.ran.msecs)}, finished after {hms((time.time() - self.started) * 1000)}')
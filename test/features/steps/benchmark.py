@@ -0,0 +1,116 @@
+import json
+import os
+import statistics
+import time
+from munch import Munch
+from steps.utils import ROOT
+import steps.utils as utils
+
+BASELINE = os.path.join(ROOT, 'test/benchmarks.json')
+
+def quartiles(samples):
+  if len(samples) == 1: return samples * 3
+  return statistics.quantiles(samples, n=4, method='inclusive')
+
+def regressed(baseline, samples, margin, resolution=0.05):
+  # slower by more than `margin` at the median, and with at least three quarters of the samples slower than the typical
+  # baseline run, so a single hiccup does not fail the build. Exports that take mere milliseconds are all noise.
+  q1, median, _ = quartiles(samples)
+  _, typical, _ = quartiles(baseline)
+  return median > typical * (1 + margin) + resolution and q1 > typical
+
+class Benchmark:
+  # Times repeated exports per (client, translator, fixture, options, cache state) and either records them as the
+  # baseline or asserts that they have not regressed against it.
+  def __init__(self, mode, path=None, samples=5, margin=0.2):
+    assert mode in ['record', 'check'], f'unsupported benchmark mode {mode}'
+    self.mode = mode
+    self.path = path or BASELINE
+    self.samples = samples
+    self.margin = margin
+    self.recorded = {}
+    self.missing = []
+    try:
+      with open(self.path) as f:
+        self.baseline = json.load(f)
+    except FileNotFoundError:
+      self.baseline = {}
+
+  def key(self, client, translator, expected, displayOptions, cache):
+    options = ','.join(sorted(option for option, on in displayOptions.items() if on and option != 'Normalize'))
+    return ' | '.join([client, translator, expected] + ([options] if options else []) + [cache])
+
+  def time(self, export, reset=None):
+    samples = []
+    for _ in range(self.samples):
+      if reset: reset()
+      started = time.time()
+      export()
+      samples.append(time.time() - started)
+    return samples
+
+  def export(self, zotero, translator, expected, displayOptions={}, collection=None):
+    def export():
+      zotero.export_library(translator=translator, displayOptions={ **displayOptions }, collection=collection)
+
+    timings = Munch(cold=self.time(export, zotero.reset_cache))
+    export() # prime the cache
+    timings.warm = self.time(export)
+    for cache, samples in timings.items():
+      self.check(self.key(zotero.client, translator, expected, displayOptions, cache), samples)
+    return timings
+
+  def cache(self, zotero, translator, invalidate):
+    # throughput and cache hit rate for cold, warm and partially invalidated caches
+    translatorID = zotero.translators.byName[translator].translatorID
+    def export():
+      zotero.export_library(translator=translator)
+    def invalidated():
+      export()
+      zotero.execute('return await Zotero.BetterBibTeX.TestSupport.invalidateCache(fraction)', fraction=invalidate)
+
+    report = []
+    for phase, reset in [('cold', zotero.reset_cache), ('warm', export), (f'{invalidate:.0%} invalidated', invalidated)]:
+      states = []
+      def prepare():
+        reset()
+        state = zotero.execute('return await Zotero.BetterBibTeX.TestSupport.cacheState(translatorID, {})', translatorID=translatorID)
+        assert state['cached'] is not None, f'{translator} has no export cache to benchmark (is caching disabled?)'
+        states.append(state)
+      samples = self.time(export, prepare)
+      self.check(self.key(zotero.client, translator, 'cache', {}, phase), samples)
+
+      items = states[0]['items']
+      secs = statistics.median(samples)
+      report.append(Munch(phase=phase, items=items, secs=secs, throughput=items / secs if secs else 0, hits=statistics.median(state['cached'] / items if items else 0 for state in states)))
+
+    for r in report:
+      utils.print(f'{translator} {r.phase}: {r.throughput:.0f} items/s, {r.hits:.0%} cache hits')
+    return report
+
+  def check(self, key, samples):
+    utils.print(f'benchmark {key}: median {statistics.median(samples):.3f}s over {len(samples)} samples')
+    if self.mode == 'record':
+      self.recorded[key] = Munch(median=round(statistics.median(samples), 4), samples=[round(s, 4) for s in samples])
+      return
+
+    if key not in self.baseline:
+      self.missing.append(key)
+      return
+    baseline = self.baseline[key]['samples']
+    assert not regressed(baseline, samples, self.margin), f'{key}: median {statistics.median(samples):.3f}s is more than {self.margin:.0%} slower than the baseline {statistics.median(baseline):.3f}s (samples: {", ".join(f"{s:.3f}" for s in samples)})'
+
+  def save(self):
+    if self.missing:
+      utils.print(f'{len(self.missing)} benchmarks have no baseline, record them with --benchmark record')
+    if self.mode != 'record' or not self.recorded: return
+    # other test bins may have recorded in the meantime
+    try:
+      with open(self.path) as f:
+        baseline = json.load(f)
+    except FileNotFoundError:
+      baseline = {}
+    baseline.update(self.recorded)
+    with open(self.path, 'w') as f:
+      json.dump(dict(sorted(baseline.items())), f, indent='  ')
+    utils.print(f'recorded {len(self.recorded)} benchmarks in {self.path}')
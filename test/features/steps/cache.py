@@ -0,0 +1,72 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+from steps.utils import ROOT
+
+CACHE = os.path.join(ROOT, '.cache')
+
+def digest(*parts):
+  h = hashlib.sha1()
+  for part in parts:
+    h.update(repr(part).encode('utf-8'))
+    h.update(b'\0')
+  return h.hexdigest()
+
+def stamp(path):
+  if path is None or not os.path.exists(path): return None
+  st = os.stat(path)
+  return (st.st_mtime_ns, st.st_size)
+
+class Cache:
+  # in-process LRU in front of an optional on-disk store. Values are kept pickled in both, so every hit hands out a
+  # fresh copy that callers are free to mutate. Safe to use from the driver's worker threads.
+  def __init__(self, name=None, size=32):
+    self.lock = threading.RLock()
+    self.size = size
+    self.lru = OrderedDict()
+    self.path = name and os.path.join(CACHE, name)
+    if self.path: os.makedirs(self.path, exist_ok=True)
+
+  def get(self, key, version=None):
+    with self.lock:
+      return self._get(key, version)
+
+  def _get(self, key, version):
+    if key in self.lru:
+      _version, value = self.lru[key]
+      if _version == version:
+        self.lru.move_to_end(key)
+        return pickle.loads(value)
+      del self.lru[key]
+
+    if not self.path: return None
+    try:
+      with open(os.path.join(self.path, key), 'rb') as f:
+        _version, value = pickle.load(f)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+      return None
+    if _version != version: return None
+    self.remember(key, version, value)
+    return pickle.loads(value)
+
+  def set(self, key, value, version=None):
+    value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    self.remember(key, version, value)
+
+    if not self.path: return
+    # the key identifies the fixture, the version its contents; stale entries are overwritten in place
+    fd, tmp = tempfile.mkstemp(dir=self.path)
+    with os.fdopen(fd, 'wb') as f:
+      pickle.dump((version, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, os.path.join(self.path, key))
+
+  def remember(self, key, version, value):
+    with self.lock:
+      self.lru[key] = (version, value)
+      self.lru.move_to_end(key)
+      while len(self.lru) > self.size:
+        self.lru.popitem(last=False)
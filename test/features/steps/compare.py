@@ -0,0 +1,163 @@
+import difflib
+import io
+import itertools
+import json
+import re
+import textwrap
+from collections import OrderedDict
+
+def bibtex_entries(lines):
+  entry = []
+  for line in lines:
+    if line.startswith('@') and entry:
+      yield ''.join(entry)
+      entry = []
+    entry.append(line)
+  if entry: yield ''.join(entry)
+
+def csl_items(f, chunk=65536):
+  # incremental parse of a top-level JSON array, one item in memory at a time
+  decoder = json.JSONDecoder(object_pairs_hook=OrderedDict)
+  buffer = ''
+  opened = False
+  eof = False
+  while True:
+    buffer = buffer.lstrip()
+    if not buffer:
+      if eof: raise ValueError('unexpected end of CSL JSON')
+      data = f.read(chunk)
+      eof = not data
+      buffer += data
+      continue
+
+    if not opened:
+      if buffer[0] != '[': raise ValueError(f'expected CSL JSON array, found {json.dumps(buffer[:20])}')
+      opened = True
+      buffer = buffer[1:]
+      continue
+
+    if buffer[0] == ']': return
+    if buffer[0] == ',':
+      buffer = buffer[1:]
+      continue
+
+    try:
+      item, end = decoder.raw_decode(buffer)
+    except json.JSONDecodeError:
+      if eof: raise
+      data = f.read(chunk)
+      eof = not data
+      buffer += data
+      continue
+    yield item
+    buffer = buffer[end:]
+
+def stripped(chunks):
+  # equivalent of comparing `text.strip()` for the whole file
+  previous = None
+  for chunk in chunks:
+    if previous is None:
+      chunk = chunk.lstrip()
+      if chunk == '': continue
+    else:
+      yield previous
+    previous = chunk
+  if previous is not None: yield previous.rstrip()
+
+def serialized(items):
+  for item in items:
+    yield json.dumps(item, sort_keys=True, indent='  ')
+
+def assert_equal_entries(expected, found, limit=5, context=3):
+  shown = []
+  differ = 0
+  n = 0
+  for n, (e, f) in enumerate(itertools.zip_longest(expected, found), start=1):
+    if e == f: continue
+
+    differ += 1
+    if len(shown) < limit:
+      shown.append('\n'.join(difflib.unified_diff(
+        [] if e is None else e.split('\n'),
+        [] if f is None else f.split('\n'),
+        fromfile=f'expected entry {n}' if e is not None else 'expected: no entry',
+        tofile=f'found entry {n}' if f is not None else 'found: no entry',
+        lineterm='',
+        n=context
+      )))
+
+  if differ == 0: return
+  if differ > len(shown): shown.append(f'... {differ - len(shown)} more')
+  raise AssertionError(f'\n{differ} of {n} entries differ\n' + '\n'.join(shown))
+
+BIBTEX_HEADER = re.compile(r'@(\w+)\s*[{(]\s*([^,\s]*)\s*,')
+BIBTEX_FIELD = re.compile(r'\s+([\w:.+-]+)\s*=')
+
+def bibtex_keyed(entries):
+  keyed = OrderedDict()
+  for n, entry in enumerate(entries):
+    if header := BIBTEX_HEADER.match(entry):
+      key = header.group(2)
+    else: # @comment, @preamble, @string
+      key = f'{entry.split("{")[0].strip()} #{n}'
+    # duplicate keys are legitimate test subjects
+    _key, dup = key, 1
+    while key in keyed:
+      dup += 1
+      key = f'{_key} #{dup}'
+    keyed[key] = entry
+  return keyed
+
+def bibtex_fields(entry):
+  fields = OrderedDict()
+  lines = entry.rstrip().split('\n')
+  fields['@'] = lines[0]
+  if len(lines) > 1 and lines[-1].strip() == '}': lines.pop()
+  field = None
+  for line in lines[1:]:
+    if m := BIBTEX_FIELD.match(line):
+      field = m.group(1).lower()
+      fields[field] = line.strip()
+    elif field is not None:
+      fields[field] += '\n' + line.strip()
+    elif line.strip() not in ['', '}']:
+      fields['@'] += '\n' + line
+  return fields
+
+def assert_equal_bibtex(expected, found, limit=10):
+  if expected == found: return
+
+  expected = bibtex_keyed(stripped(bibtex_entries(io.StringIO(expected))))
+  found = bibtex_keyed(stripped(bibtex_entries(io.StringIO(found))))
+
+  report = []
+  missing = [key for key in expected if key not in found]
+  unexpected = [key for key in found if key not in expected]
+  differ = [key for key, entry in expected.items() if key in found and found[key] != entry]
+
+  for key in missing: report.append(f'- @{{{key}}} missing')
+  for key in unexpected: report.append(f'+ @{{{key}}} unexpected')
+
+  for key in differ:
+    report.append(f'@{{{key}}}:')
+    e = bibtex_fields(expected[key])
+    f = bibtex_fields(found[key])
+    fields = [field for field in list(e.keys()) + [field for field in f.keys() if field not in e] if e.get(field) != f.get(field)]
+    for field in fields:
+      if field in e: report.append(textwrap.indent(e[field], '  - '))
+      if field in f: report.append(textwrap.indent(f[field], '  + '))
+    if not fields: # whitespace or layout
+      report += list(difflib.unified_diff(expected[key].split('\n'), found[key].split('\n'), lineterm='', n=1))[2:]
+
+  if not report:
+    # same entries, different order
+    order = [(n, e, f) for n, (e, f) in enumerate(zip(expected.keys(), found.keys()), start=1) if e != f]
+    report += [f'entry {n}: expected @{{{e}}}, found @{{{f}}}' for n, e, f in order[:limit]]
+
+  total = len(missing) + len(unexpected) + len(differ)
+  if total:
+    summary = f'\n{total} of {len(expected)} entries differ ({len(missing)} missing, {len(unexpected)} unexpected, {len(differ)} changed)\n'
+  else:
+    summary = f'\n{len(expected)} entries match, but not in the expected order\n'
+  if len(report) > limit * 10: report = report[:limit * 10] + [f'... {len(report) - limit * 10} more lines']
+  raise AssertionError(summary + '\n'.join(report))
@@ -0,0 +1,65 @@
+import asyncio
+import io
+import socket
+import threading
+import urllib.error
+
+class Driver:
+  # An asyncio loop on a background thread for the whole session. The synchronous steps hand it bridge requests and
+  # side work (fixture parsing, writing exports) so that work overlaps with waiting on Zotero; since requests carry
+  # their own host and port, several Zotero instances can share one driver.
+  def __init__(self):
+    self.loop = asyncio.new_event_loop()
+    threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+  def run(self, coro):
+    return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+  def spawn(self, fn, *args, **kwargs):
+    # runs `fn` off the main thread; returns a concurrent.futures.Future
+    return asyncio.run_coroutine_threadsafe(asyncio.to_thread(fn, *args, **kwargs), self.loop)
+
+  async def post(self, host, port, path, body, headers={}, timeout=None):
+    url = f'http://{host}:{port}{path}'
+    try:
+      return await asyncio.wait_for(self.request(host, port, path, body, headers, url), timeout)
+    except asyncio.TimeoutError:
+      raise socket.timeout(f'{url} timed out after {timeout}s')
+    except urllib.error.URLError:
+      raise
+    except OSError as err:
+      raise urllib.error.URLError(err)
+
+  async def request(self, host, port, path, body, headers, url):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+      head = [f'POST {path} HTTP/1.1', f'Host: {host}:{port}', f'Content-Length: {len(body)}', 'Connection: close']
+      head += [f'{header}: {value}' for header, value in headers.items()]
+      writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+      await writer.drain()
+
+      status = (await reader.readline()).decode('latin-1').split(' ', 2)
+      code = int(status[1])
+      received = {}
+      while (line := (await reader.readline()).decode('latin-1').strip()):
+        header, value = line.split(':', 1)
+        received[header.strip().lower()] = value.strip()
+
+      if received.get('transfer-encoding') == 'chunked':
+        response = b''
+        while (size := int((await reader.readline()).strip(), 16)):
+          response += await reader.readexactly(size)
+          await reader.readline()
+      elif 'content-length' in received:
+        response = await reader.readexactly(int(received['content-length']))
+      else:
+        response = await reader.read()
+    except (IndexError, ValueError, asyncio.IncompleteReadError) as err:
+      # an empty or cut-off response; a ConnectionError ends up as the URLError callers retry on
+      raise ConnectionError(f'{url}: incomplete response') from err
+    finally:
+      writer.close()
+
+    if code != 200:
+      raise urllib.error.HTTPError(url, code, status[2].strip() if len(status) > 2 else '', received, io.BytesIO(response))
+    return response
@@ -1,4 +1,8 @@
 from steps.zotero import Zotero
+from steps.balance import Balance
+from steps.impact import Impact
+from steps.memory import Sampler
+from steps.benchmark import Benchmark
 from behave.contrib.scenario_autoretry import patch_scenario_with_autoretry
 from behave.tag_matcher import ActiveTagMatcher, setup_active_tag_values
 import re
@@ -13,6 +17,7 @@ import json
 active_tag_value_provider = {
   'client': 'zotero',
   'slow': 'false',
+  'benchmark': 'false',
 }
 active_tag_matcher = ActiveTagMatcher(active_tag_value_provider)
 
@@ -34,7 +39,24 @@ def before_feature(context, feature):
 def before_all(context):
   context.memory = Munch(total=None, increase=None)
   context.zotero = Zotero(context.config.userdata)
+  if mode := context.config.userdata.get('benchmark'):
+    context.benchmark = Benchmark(mode, context.config.userdata.get('benchmark_baseline'), int(context.config.userdata.get('benchmark_samples', 5)), float(context.config.userdata.get('benchmark_margin', 0.2)))
+  else:
+    context.benchmark = None
+  context.sampler = Sampler(lambda: context.zotero.proc, context.config.userdata.get('memory_log'), float(context.config.userdata.get('memory_every', 0)))
   setup_active_tag_values(active_tag_value_provider, context.config.userdata)
+  if rev := context.config.userdata.get('changed_since'):
+    context.impact = Impact(rev)
+    context.impact.report([scenario for feature in context._runner.features for scenario in feature.walk_scenarios() if not active_tag_matcher.should_exclude_with(scenario.effective_tags)])
+  else:
+    context.impact = None
+  def runs(scenario):
+    return not active_tag_matcher.should_exclude_with(scenario.effective_tags) and (not context.impact or context.impact.affects(scenario))
+  if balance is not None:
+    context.balance = Balance(balance, context.config.userdata.get('slow') == 'true', context.config.userdata.get('bin'))
+    context.balance.plan(context._runner.features, context.config.userdata.get('order'), runs=runs)
+  else:
+    context.balance = None
   # test whether the existing references, if any, have gotten a cite key
   context.zotero.export_library(translator = 'Better BibTeX')
 
@@ -48,18 +70,18 @@ def before_scenario(context, scenario):
   if active_tag_matcher.should_exclude_with(scenario.effective_tags):
     scenario.skip(f"DISABLED ACTIVE-TAG {str(active_tag_value_provider)}")
     return
-  if balance is not None and 'bin' in context.config.userdata:
-    if re.sub(r' -- @[0-9]+\.[0-9]+ ', '', scenario.name) in balance['slow' if active_tag_value_provider['slow'] == 'true' else 'fast']['1']:
-      test_bin = '1'
-    else:
-      test_bin = '2'
-    if context.config.userdata['bin'] != test_bin:
-      scenario.skip(f'TESTED IN BIN {test_bin}')
-      return
+  if context.balance and (test_bin := context.balance.skip(scenario.name)):
+    scenario.skip(f'TESTED IN BIN {test_bin}')
+    return
+  if context.impact and not context.impact.affects(scenario):
+    scenario.skip(f'NOT AFFECTED BY CHANGES SINCE {context.impact.rev}')
+    return
   if 'test' in context.config.userdata and not any(test in scenario.name.lower() for test in context.config.userdata['test'].lower().split(',')):
     scenario.skip(f"ONLY TESTING SCENARIOS WITH {context.config.userdata['test']}")
 
+  context.zotero.profile.start(scenario)
   context.zotero.reset(scenario.name)
+  if context.sampler.enabled: context.sampler.begin(scenario.name)
   context.displayOptions = {}
   context.selected = []
   context.imported = None
@@ -75,9 +97,32 @@ def before_scenario(context, scenario):
       context.timeout = max(context.timeout, int(tag.split('=')[1]))
   context.zotero.config.timeout = context.timeout
 
+def after_all(context):
+  if context.benchmark: context.benchmark.save()
+  context.sampler.report()
+  if context.balance: context.balance.report()
+
+def after_step(context, step):
+  context.zotero.profile.step(step)
+
 def after_scenario(context, scenario):
-  if context.memory.increase or context.memory.total:
-    memory = Munch.fromDict(context.zotero.execute('return Zotero.BetterBibTeX.TestSupport.memoryState("behave cap")'))
+  context.zotero.profile.done(scenario, context.zotero.heartbeat.inflight())
+  ran = scenario.status.name != 'skipped'
+  if context.balance and ran: context.balance.done(scenario)
+
+  memory = None
+  if context.memory.increase or context.memory.total or (ran and context.sampler.enabled):
+    # one snapshot serves both the caps and the sampler; its delta is the growth since the previous scenario ended
+    try:
+      memory = Munch.fromDict(context.zotero.execute('return Zotero.BetterBibTeX.TestSupport.memoryState("behave cap")'))
+    except Exception as err:
+      capped = [f'{cap} cap of {mb}MB' for cap, mb in [('increase', context.memory.increase), ('total', context.memory.total)] if mb]
+      if capped: raise AssertionError(f'could not check the memory {" and ".join(capped)}: {err}') from err
+      # only the sampler wanted this, and a crashed or hung client must not hide the scenario's own failure
+      utils.print(f'no memory sample after {json.dumps(scenario.name)}: {err}')
+  if ran and context.sampler.enabled: context.sampler.end(memory)
+
+  if memory:
     if context.memory.increase and memory.delta > context.memory.increase:
       raise AssertionError(f'Memory increase cap of {context.memory.increase}MB exceeded by {memory.delta - context.memory.increase}MB')
     if context.memory.total and memory.resident > context.memory.total:
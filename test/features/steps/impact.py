@@ -0,0 +1,90 @@
+import glob
+import json
+import os
+import re
+import subprocess
+from steps.utils import ROOT
+from steps.store import STORE, manifests
+import steps.utils as utils
+
+DEPENDENCIES = os.path.join(ROOT, 'test/dependencies.json')
+
+# changes here can affect any scenario
+CORE = [
+  'test/features/steps/',
+  'test/features/steps/environment.py',
+  'test/behave',
+  'behave.ini',
+  'requirements.txt',
+  'package.json',
+  'package-lock.json',
+  'esbuild.js',
+  'setup/',
+  'schema/',
+  'test/fixtures/profile/',
+]
+# bundles loaded for every scenario
+SHARED = ['plugin', 'worker']
+
+def changed_since(rev):
+  tracked = subprocess.check_output(['git', 'diff', '--name-only', rev, '--'], cwd=ROOT, encoding='utf-8').split('\n')
+  untracked = subprocess.check_output(['git', 'ls-files', '--others', '--exclude-standard'], cwd=ROOT, encoding='utf-8').split('\n')
+  return set(path for path in tracked + untracked if path)
+
+def fixture(path):
+  # client patches and store manifests change the fixture they apply to
+  return re.sub(r'(\.(zotero|jurism)\.patch|\.store)$', '', path)
+
+def bundles():
+  # inputs per esbuild bundle, from the metafiles of the last build
+  inputs = {}
+  for metafile in glob.glob(os.path.join(ROOT, 'gen/*.json')):
+    with open(metafile) as f:
+      meta = json.load(f)
+    if type(meta) != dict or 'inputs' not in meta: continue
+    inputs[os.path.splitext(os.path.basename(metafile))[0]] = set(source.split(':')[-1] for source in meta['inputs'])
+  return inputs
+
+class Impact:
+  def __init__(self, rev, dependencies=DEPENDENCIES):
+    self.rev = rev
+    self.changed = changed_since(rev)
+    try:
+      with open(dependencies) as f:
+        self.dependencies = json.load(f)
+    except FileNotFoundError:
+      self.dependencies = {}
+
+    inputs = bundles()
+    self.everything = [path for path in self.changed if any(path == core or (core.endswith('/') and path.startswith(core)) for core in CORE)]
+    if inputs:
+      self.everything += [path for path in self.changed if any(path in inputs.get(bundle, []) for bundle in SHARED)]
+      self.translators = set(translator for translator, sources in inputs.items() if translator not in SHARED and sources & self.changed)
+    else:
+      # no build metadata to go by
+      self.everything += [path for path in self.changed if path.startswith('content/') or path.startswith('translators/')]
+      self.translators = set()
+    self.fixtures = set(fixture(path) for path in self.changed if path.startswith('test/fixtures/'))
+    # a changed item pack can change any packed fixture
+    if any(path.startswith(os.path.relpath(STORE, ROOT) + '/') for path in self.changed):
+      self.fixtures |= set(fixture(os.path.relpath(path, ROOT)) for path in manifests())
+    self.features = set(path for path in self.changed if path.startswith('test/features/') and path.endswith('.feature'))
+
+  def affects(self, scenario):
+    if self.everything: return True
+    if os.path.relpath(os.path.join(ROOT, scenario.feature.filename), ROOT) in self.features: return True
+    # scenarios that have not been indexed yet always run
+    if not (used := self.dependencies.get(scenario.name)): return True
+    if any(translator in self.translators for translator in used['translators']): return True
+    return any(fixture(path) in self.fixtures for path in used['fixtures'])
+
+  def report(self, scenarios):
+    affected = [scenario for scenario in scenarios if self.affects(scenario)]
+    utils.print(f'{len(self.changed)} files changed since {self.rev}: running {len(affected)} of {len(scenarios)} scenarios')
+    if self.everything:
+      utils.print(f'  everything, because of {", ".join(sorted(self.everything)[:5])}')
+    else:
+      for translator in sorted(self.translators):
+        utils.print(f'  translator: {translator}')
+      for path in sorted(self.features | self.fixtures):
+        utils.print(f'  {path}')
@@ -1,6 +1,8 @@
 import json
+import hashlib
+from collections import Counter
 from copy import deepcopy
-from steps.utils import html2md, HashableDict, print
+from steps.utils import html2md, HashableDict, print, serialize, unified_diff
 import steps.utils as utils
 
 def unnest(obj, key):
@@ -31,7 +33,10 @@ def strip_obj(data):
   else:
     return data
 
-def clean_item(item):
+def digest(obj):
+  return hashlib.sha1(json.dumps(obj, sort_keys=True).encode('utf-8')).hexdigest()
+
+def clean_item(item, lower_extra=False):
   item = deepcopy(item)
 
   un_multi(item)
@@ -54,6 +59,8 @@ def clean_item(item):
   # make diffs more readable
   if 'extra' in item and type(item['extra']) != list:
       item['extra'] = item['extra'].split('\n')
+  if lower_extra and 'extra' in item:
+    item['extra'] = [line.lower() for line in item['extra']]
 
   if 'notes' in item:
     item['notes'] = sorted(strip_obj([html2md(unnest(note, 'note')) for note in item.get('notes', [])]))
@@ -71,22 +78,28 @@ def clean_item(item):
   item = strip_obj(item)
   return item
 
-def sort_collection(coll):
-  coll['collections'] = sorted([sort_collection(c) for c in coll['collections']], key=lambda c: c.__hash__())
-  coll['items'] = sorted(coll['items'], key=lambda i: i.__hash__())
+def sort_collection(coll, hashes):
+  coll['collections'] = sorted([sort_collection(c, hashes) for c in coll['collections']], key=lambda c: hashes[id(c)])
+  coll['items'] = sorted(coll['items'])
+  hashes[id(coll)] = digest(coll)
   return coll
 
-def load(lib):
+def load(lib, lower_extra=False):
+  # returns the cleaned library and its digests: per item and per top-level collection in library order, and one for
+  # each other key
   lib = HashableDict(lib)
 
   lib.pop('config', None)
   lib.pop('version', None)
 
   items = {
-    item['itemID']: HashableDict(clean_item(item))
+    item['itemID']: HashableDict(clean_item(item, lower_extra))
     for item in lib['items']
   }
-  lib['items'] = sorted(items.values(), key=lambda item: item.get('title', '') + '::' + item.__hash__())
+  # every item is hashed exactly once; collections refer to items by these hashes
+  hashes = { itemID: digest(item) for itemID, item in items.items() }
+  order = sorted(items.keys(), key=lambda itemID: items[itemID].get('title', '') + '::' + hashes[itemID])
+  lib['items'] = [items[itemID] for itemID in order]
   for item in lib['items']:
     if 'relations' in item: utils.print(str(item['relations']))
 
@@ -101,9 +114,65 @@ def load(lib):
     if 'collections' not in coll: coll['collections'] = []
 
   for coll in list(collections.values()):
-    coll['items'] = sorted([ items[itemID].__hash__() for itemID in coll['items'] ])
+    coll['items'] = [ hashes[itemID] for itemID in coll['items'] ]
     coll['collections'] = [ collections[key] for key in coll['collections'] ]
 
-  lib['collections'] = sorted([sort_collection(c) for c in lib['collections']], key=lambda c: c.__hash__())
-
-  return lib
+  # subcollections are hashed bottom-up, once each
+  collection_hashes = {}
+  lib['collections'] = sorted([sort_collection(c, collection_hashes) for c in lib['collections']], key=lambda c: collection_hashes[id(c)])
+
+  digests = { key: digest(value) for key, value in lib.items() if key not in ['items', 'collections'] }
+  digests['items'] = [hashes[itemID] for itemID in order]
+  digests['collections'] = [collection_hashes[id(coll)] for coll in lib['collections']]
+  return lib, digests
+
+def diff_paths(expected, found, path='$'):
+  # recurses unconditionally, since python equality would pass true for 1 and 1 for 1.0
+  if isinstance(expected, dict) and isinstance(found, dict):
+    for key in sorted(set(expected.keys()) | set(found.keys())):
+      if key not in expected or key not in found:
+        yield f'{path}.{key}'
+      else:
+        yield from diff_paths(expected[key], found[key], f'{path}.{key}')
+  elif isinstance(expected, list) and isinstance(found, list) and len(expected) == len(found):
+    for i, (e, f) in enumerate(zip(expected, found)):
+      yield from diff_paths(e, f, f'{path}[{i}]')
+  elif type(expected) != type(found) or expected != found:
+    yield path
+
+def compare(expected, found):
+  expected, expected_digests = load(expected, lower_extra=True)
+  found, found_digests = load(found, lower_extra=True)
+
+  # the digests are over the serialized forms, so true/1 and 1/1.0 still differ
+  if expected_digests == found_digests: return
+
+  def label(item):
+    return json.dumps(item.get('title', item.get('itemType', '')))
+
+  report = []
+  expected_items = dict(zip(expected_digests['items'], expected['items']))
+  found_items = dict(zip(found_digests['items'], found['items']))
+  missing = [item for h, item in expected_items.items() if h not in found_items]
+  unexpected = [item for h, item in found_items.items() if h not in expected_items]
+
+  counts = (Counter(expected_digests['items']), Counter(found_digests['items']))
+  if not missing and not unexpected and counts[0] != counts[1]:
+    report.append('duplicate items differ')
+
+  for item in missing:
+    match = next((other for other in unexpected if other.get('title') == item.get('title') and other.get('itemType') == item.get('itemType')), None)
+    if match is None:
+      report.append(f'only in expected: {label(item)}')
+    else:
+      unexpected.remove(match)
+      report.append(f'{label(item)}: ' + ', '.join(diff_paths(item, match)))
+  for item in unexpected:
+    report.append(f'only in found: {label(item)}')
+
+  for key in sorted(set(expected.keys()) | set(found.keys())):
+    if key == 'items': continue
+    if expected_digests.get(key) != found_digests.get(key):
+      report.append(f'{key}: ' + ', '.join(diff_paths(expected.get(key), found.get(key), f'$.{key}')))
+
+  raise AssertionError('\n' + '\n'.join(report) + '\n' + unified_diff(serialize(expected), serialize(found)))
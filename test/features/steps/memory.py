@@ -0,0 +1,89 @@
+import csv
+import os
+import threading
+import time
+import psutil
+from munch import Munch
+import steps.utils as utils
+
+MB = 1024 * 1024
+
+def resident(proc):
+  # RSS of the Zotero process tree, in MB
+  if proc is None: return None
+  try:
+    root = psutil.Process(proc.pid)
+    rss = 0
+    for p in [root] + root.children(recursive=True):
+      try:
+        rss += p.memory_info().rss
+      except psutil.NoSuchProcess:
+        pass
+    return rss / MB
+  except psutil.NoSuchProcess:
+    return None
+
+class Sampler:
+  # Samples the RSS of the Zotero process tree every `every` seconds on a background thread and keeps the per-scenario
+  # peak next to the resident/delta figures Zotero reports itself. Writes `memory.csv` (time series) and
+  # `scenarios.csv` (per-scenario table) to `path` when given.
+  def __init__(self, proc, path=None, every=1.0):
+    self.proc = proc
+    self.every = every
+    self.path = path
+    self.lock = threading.Lock()
+    self.current = None
+    self.scenarios = []
+    self.started = time.time()
+
+    if self.path:
+      os.makedirs(self.path, exist_ok=True)
+      self.series = open(os.path.join(self.path, 'memory.csv'), 'w', newline='')
+      self.table = open(os.path.join(self.path, 'scenarios.csv'), 'w', newline='')
+      csv.writer(self.series).writerow(['secs', 'scenario', 'rss'])
+      csv.writer(self.table).writerow(['scenario', 'resident', 'delta', 'rss_start', 'rss_peak', 'rss_end'])
+
+    self.enabled = bool(self.path) or self.every > 0
+    self.stop = threading.Event()
+    if self.every > 0:
+      threading.Thread(target=self.run, daemon=True).start()
+
+  def run(self):
+    while not self.stop.wait(self.every):
+      self.sample()
+
+  def sample(self):
+    rss = resident(self.proc())
+    if rss is None: return
+    with self.lock:
+      if self.current is not None: self.current.rss_peak = max(self.current.rss_peak, rss)
+      scenario = self.current.scenario if self.current else ''
+      if self.path:
+        csv.writer(self.series).writerow([f'{time.time() - self.started:.1f}', scenario, f'{rss:.1f}'])
+    return rss
+
+  def begin(self, scenario):
+    rss = resident(self.proc()) or 0
+    with self.lock:
+      self.current = Munch(scenario=scenario, rss_start=rss, rss_peak=rss)
+
+  def end(self, state):
+    # `state` is None when Zotero could not be asked; the scenario is then recorded without resident/delta
+    rss = self.sample() or 0
+    with self.lock:
+      if self.current is None: return
+      done, self.current = self.current, None
+    done.update(resident=state and state['resident'], delta=state and state['delta'], rss_end=rss, rss_peak=max(done.rss_peak, rss))
+    self.scenarios.append(done)
+    if self.path:
+      csv.writer(self.table).writerow([done.scenario] + ['' if done[k] is None else f'{done[k]:.1f}' for k in ['resident', 'delta', 'rss_start', 'rss_peak', 'rss_end']])
+      self.table.flush()
+      self.series.flush()
+
+  def report(self, top=10):
+    self.stop.set()
+    if not self.scenarios: return
+    utils.print(f'peak memory: {max(s.rss_peak for s in self.scenarios):.0f}MB')
+    for s in sorted([s for s in self.scenarios if s.delta is not None], key=lambda s: -s.delta)[:top]:
+      if s.delta <= 0: break
+      utils.print(f'  +{s.delta:.0f}MB (peak {s.rss_peak:.0f}MB): {s.scenario}')
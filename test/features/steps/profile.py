@@ -0,0 +1,84 @@
+import csv
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+from munch import Munch
+
+def slug(name):
+  return re.sub(r'[^a-zA-Z0-9]+', '-', name).strip('-')[:80]
+
+def label(script):
+  # first meaningful line of a bridge script
+  for line in script.split('\n'):
+    line = line.strip()
+    if line and not line.startswith('const ') and not line.startswith('//'): return line[:80]
+  return ''
+
+class Profile:
+  # Collects timings per scenario and writes them to `<path>/<n>-<scenario>.json` and `<path>/trace.csv`. Disabled when
+  # no path is given, in which case every call is a no-op.
+  def __init__(self, path=None):
+    self.path = path
+    self.scenario = None
+    self.n = 0
+    if not self.path: return
+
+    os.makedirs(self.path, exist_ok=True)
+    self.csv = open(os.path.join(self.path, 'trace.csv'), 'w', newline='')
+    self.trace = csv.writer(self.csv)
+    self.trace.writerow(['scenario', 'kind', 'name', 'secs', 'details'])
+
+  def start(self, scenario):
+    if not self.path: return
+    self.n += 1
+    self.scenario = Munch(
+      name=scenario.name,
+      feature=scenario.feature.filename,
+      started=time.time(),
+      steps=[],
+      events=[],
+    )
+
+  def event(self, kind, name, secs, **details):
+    if not self.path or not self.scenario: return
+    self.scenario.events.append(Munch(kind=kind, name=name, secs=secs, **details))
+    self.trace.writerow([self.scenario.name, kind, name, f'{secs:.4f}', json.dumps(details) if details else ''])
+
+  @contextmanager
+  def measure(self, kind, name='', **details):
+    if not self.path or not self.scenario:
+      yield details
+      return
+    started = time.time()
+    try:
+      yield details
+    finally:
+      self.event(kind, name, time.time() - started, **details)
+
+  def step(self, step):
+    if not self.path or not self.scenario: return
+    self.scenario.steps.append(Munch(name=f'{step.keyword} {step.name}', secs=step.duration, status=step.status.name))
+    self.trace.writerow([self.scenario.name, 'step', f'{step.keyword} {step.name}', f'{step.duration:.4f}', ''])
+
+  def done(self, scenario, inflight=[]):
+    if not self.path or not self.scenario: return
+
+    # bridge calls that never returned, typically because the scenario timed out
+    for name, secs in inflight:
+      self.event('inflight', name, secs)
+
+    totals = {}
+    for event in self.scenario.events:
+      total = totals.setdefault(event.kind, Munch(n=0, secs=0))
+      total.n += 1
+      total.secs += event.secs
+      for part in ['network', 'server']:
+        if part in event: total[part] = total.get(part, 0) + event[part]
+    self.scenario.update(duration=scenario.duration, status=scenario.status.name, totals=totals)
+
+    with open(os.path.join(self.path, f'{self.n:04d}-{slug(self.scenario.name)}.json'), 'w') as f:
+      json.dump(self.scenario, f, indent='  ')
+    self.csv.flush()
+    self.scenario = None
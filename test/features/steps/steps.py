@@ -10,6 +10,7 @@ from hamcrest import assert_that, equal_to
 from steps.utils import assert_equal_diff, expand_scenario_variables
 import steps.utils as utils
 import steps.zotero as zotero
+from steps.store import store
 import glob
 
 from contextlib import contextmanager
@@ -94,11 +95,10 @@ def step_impl(context, db, source):
   source = expand_scenario_variables(context, source)
   context.imported = source
 
-  with open(os.path.join(ROOT, 'test', 'fixtures', source)) as f:
-    data = json.load(f)
-    items = data['items']
-    #references = sum([ 1 + len(item.get('attachments', [])) + len(item.get('notes', [])) for item in items ])
-    references = len(items)
+  data, _ = context.zotero.load(source)
+  items = data['items']
+  #references = sum([ 1 + len(item.get('attachments', [])) + len(item.get('notes', [])) for item in items ])
+  references = len(items)
 
   context.zotero.restart(timeout=context.timeout, db=db)
   assert_that(context.zotero.execute('return await Zotero.BetterBibTeX.TestSupport.librarySize()'), equal_to(references))
@@ -191,6 +191,16 @@ def export_library(context, translator='BetterBibTeX JSON', collection=None, exp
   if timeout is not None:
     assert(runtime < timeout), f'Export runtime of {runtime} exceeded set maximum of {timeout}'
 
+  # file exports are timed exporting to a string, except auto-exports, which would register again on every sample,
+  # and exports with file data, which need a directory to go to
+  if context.benchmark and expected and not displayOptions.get('keepUpdated') and not displayOptions.get('exportFileData'):
+    context.benchmark.export(context.zotero, translator, expected, displayOptions, collection)
+
+@then(u'I benchmark the cache for "{translator}" cold, warm and with {invalidate:d}% invalidated')
+def step_impl(context, translator, invalidate):
+  assert context.benchmark, 'cache benchmarks need --benchmark'
+  context.benchmark.cache(context.zotero, translator, invalidate / 100)
+
 @then(u'a quick-copy using "{translator}" should match {path}')
 def step_impl(context, translator, path):
   context.zotero.quick_copy(translator=translator, expected=expand_scenario_variables(context, json.loads(path)), itemIDs=context.selected)
@@ -254,14 +264,12 @@ def step_impl(context, expected):
 @step(u'I select the item with a field that {mode} "{value}"')
 def step_impl(context, mode, value):
   context.selected += context.zotero.execute('return await Zotero.BetterBibTeX.TestSupport.find({[mode]: value})', mode=mode, value=value)
-  context.zotero.execute('await Zotero.BetterBibTeX.TestSupport.select(ids)', ids=context.selected)
-  time.sleep(3)
+  context.zotero.select(context.selected)
 
 @step(u'I select {n} items with a field that {mode} "{value}"')
 def step_impl(context, n, mode, value):
   context.selected += context.zotero.execute('return await Zotero.BetterBibTeX.TestSupport.find({[mode]: value}, n)', mode=mode, value=value, n=int(n))
-  context.zotero.execute('await Zotero.BetterBibTeX.TestSupport.select(ids)', ids=context.selected)
-  time.sleep(3)
+  context.zotero.select(context.selected)
 
 @when(u'I remove all items from "{collection}"')
 def step_impl(context, collection):
@@ -332,15 +340,15 @@ def step_impl(context, expected, found):
   else:
     expected = os.path.join(ROOT, 'test/fixtures', expected)
     context.zotero.loaded(expected)
-  with open(expected) as f:
-    expected = f.read()
+    context.zotero.uses(fixtures=[expected])
+  expected = store.text(expected)
 
   if found.startswith('~/'):
     found = os.path.join(context.tmpDir, found[2:])
   else:
     found = os.path.join(ROOT, 'test/fixtures', found)
-  with open(found) as f:
-    found = f.read()
+    context.zotero.uses(fixtures=[found])
+  found = store.text(found)
 
   assert_equal_diff(expected.strip(), found.strip())
 
@@ -350,17 +358,7 @@ def step_impl(context, seconds):
 
 @step(u'I wait at most {seconds:d} seconds until all auto-exports are done')
 def step_impl(context, seconds):
-  printed = False
-  timeout = True
-  for n in range(seconds):
-    if not context.zotero.execute('return Zotero.BetterBibTeX.TestSupport.autoExportRunning()'):
-      timeout = False
-      break
-    time.sleep(1)
-    utils.print('.', end='')
-    printed = True
-  if printed: utils.print('')
-  assert (not timeout), 'Auto-export timed out'
+  assert context.zotero.auto_exports_done(seconds), 'Auto-export timed out'
 
 @step(u'I remove "{path}"')
 def step_impl(context, path):
@@ -0,0 +1,149 @@
+import glob
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from steps.cache import stamp
+from steps.utils import ROOT
+
+FIXTURES = os.path.join(ROOT, 'test/fixtures')
+STORE = os.path.join(FIXTURES, 'store')
+MANIFEST = '.store'
+
+def serialize(item):
+  return json.dumps(item, ensure_ascii=False, separators=(',', ':'))
+
+def address(line):
+  return hashlib.sha1(line.encode('utf-8')).hexdigest()
+
+def compress(data, compression):
+  if compression == 'zst':
+    import zstandard
+    return zstandard.ZstdCompressor(level=19).compress(data)
+  # no timestamp, so an unchanged pack stays byte-identical
+  return gzip.compress(data, mtime=0)
+
+def decompress(data, compression):
+  if compression == 'zst':
+    import zstandard
+    return zstandard.ZstdDecompressor().decompress(data, max_output_size=1024 * 1024 * 1024)
+  return gzip.decompress(data)
+
+def manifests():
+  return glob.glob(os.path.join(FIXTURES, '*', '*' + MANIFEST))
+
+class Store:
+  # Content-addressed storage for BBT JSON fixtures. Every distinct item is kept once in a compressed pack
+  # (`<hash>\t<item>` lines), and a packed fixture is replaced by `<fixture>.store`: the library with its items
+  # swapped for their hashes. `load` materialises a fixture from its manifest; the pack is read once per process.
+  def __init__(self, path=STORE):
+    self.path = path
+    self.lock = threading.Lock()
+    self.items = None
+    self.stamp = None
+
+  def pack(self):
+    # zstd when that's what was packed, gzip otherwise
+    for ext in ['.zst', '.gz']:
+      pack = os.path.join(self.path, 'items.jsonl' + ext)
+      if os.path.exists(pack): return pack
+    return os.path.join(self.path, 'items.jsonl.gz')
+
+  def read(self):
+    with self.lock:
+      pack = self.pack()
+      if self.items is None or self.stamp != stamp(pack):
+        items = {}
+        if os.path.exists(pack):
+          with open(pack, 'rb') as f:
+            for line in decompress(f.read(), pack.rsplit('.', 1)[1]).decode('utf-8').split('\n'):
+              if not line: continue
+              key, item = line.split('\t', 1)
+              items[key] = item
+        self.items, self.stamp = items, stamp(pack)
+      return self.items
+
+  def packed(self, path):
+    return not os.path.exists(path) and os.path.exists(path + MANIFEST)
+
+  def version(self, path):
+    if not self.packed(path): return None
+    return (stamp(path + MANIFEST), stamp(self.pack()))
+
+  def load(self, path):
+    with open(path + MANIFEST) as f:
+      return self.materialise(f.read(), self.read(), path)
+
+  def text(self, path):
+    # the fixture as it was before it was packed, or as it is when it isn't
+    if not self.packed(path):
+      with open(path) as f:
+        return f.read()
+    with open(path + MANIFEST) as f:
+      return self.render(f.read(), self.read(), path)
+
+  def materialise(self, manifest, items, path):
+    data = json.loads(manifest, object_pairs_hook=OrderedDict)
+    missing = [key for key in data['items'] if key not in items]
+    if missing: raise ValueError(f'{os.path.relpath(path, ROOT)}: {len(missing)} items missing from {os.path.relpath(self.pack(), ROOT)}')
+    data['items'] = [json.loads(items[key], object_pairs_hook=OrderedDict) for key in data['items']]
+    return data
+
+  def render(self, manifest, items, path):
+    # the fixture as `extract` writes it back, with the trailing whitespace the manifest kept
+    return json.dumps(self.materialise(manifest, items, path), indent='  ') + manifest[len(manifest.rstrip()):]
+
+  def add(self, path):
+    # replaces the fixture at `path` by its manifest and returns the items it added, or None when the fixture would
+    # not come back byte for byte, in which case it is left alone
+    with open(path) as f:
+      text = f.read()
+    data = json.loads(text, object_pairs_hook=OrderedDict)
+    added = {}
+    for i, item in enumerate(data['items']):
+      item = serialize(item)
+      data['items'][i] = address(item)
+      added[data['items'][i]] = item
+    # the manifest keeps the trailing whitespace of the fixture so it can be restored as it was
+    manifest = json.dumps(data, indent='  ') + text[len(text.rstrip()):]
+    if self.render(manifest, added, path) != text: return None
+    with open(path + MANIFEST, 'w') as f:
+      f.write(manifest)
+    os.remove(path)
+    return added
+
+  def extract(self, path):
+    with open(path + MANIFEST) as f:
+      manifest = f.read()
+    with open(path, 'w') as f:
+      f.write(self.render(manifest, self.read(), path))
+    os.remove(path + MANIFEST)
+
+  def write(self, items, compression='gz'):
+    # only keeps items some manifest still refers to
+    used = set()
+    for manifest in manifests():
+      with open(manifest) as f:
+        used.update(json.load(f)['items'])
+
+    with self.lock:
+      self.items = None
+    if not used:
+      for pack in glob.glob(os.path.join(self.path, 'items.jsonl.*')): os.remove(pack)
+      return 0
+
+    os.makedirs(self.path, exist_ok=True)
+    pack = os.path.join(self.path, 'items.jsonl.' + compression)
+    fd, tmp = tempfile.mkstemp(dir=self.path)
+    with os.fdopen(fd, 'wb') as f:
+      f.write(compress(''.join(f'{key}\t{items[key]}\n' for key in sorted(used)).encode('utf-8'), compression))
+    os.replace(tmp, pack)
+    for stale in glob.glob(os.path.join(self.path, 'items.jsonl.*')):
+      if stale != pack: os.remove(stale)
+    return len(used)
+
+store = Store()
@@ -11,8 +11,13 @@ import time
 import urllib.request
 import psutil
 import shlex
-from collections import UserDict
-import copy
+from collections import UserDict, OrderedDict
+import hashlib
+import pickle
+import atexit
+import re
+import tempfile
+import importlib.metadata
 
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning, module='bs4', message='.*looks like a URL.*')
@@ -48,8 +53,11 @@ class benchmark(object):
   def elapsed(self):
     return time.time() - self.started
 
+def unified_diff(expected, found):
+  return '\n'.join(difflib.unified_diff(expected.split('\n'), found.split('\n'), fromfile='expected', tofile='found', lineterm=''))
+
 def assert_equal_diff(expected, found):
-  assert expected == found, '\n' + '\n'.join(difflib.unified_diff(expected.split('\n'), found.split('\n'), fromfile='expected', tofile='found', lineterm=''))
+  assert expected == found, '\n' + unified_diff(expected, found)
 
 def expand_scenario_variables(context, filename, star=True):
   scenario = None
@@ -62,27 +70,96 @@ def expand_scenario_variables(context, filename, star=True):
     if star: filename = filename.replace('*', scenario)
   return filename
 
-def clean_html(html):
+class memoize(object):
+  # bounded LRU keyed on the content hash of the (string) argument, optionally persisted across runs
+  def __init__(self, fn, size=50000):
+    self.fn = fn
+    self.size = size
+    self.cache = OrderedDict()
+    self.path = None
+    self.dirty = False
+    self.__name__ = fn.__name__
+
+  def __call__(self, text):
+    key = hashlib.sha1(text.encode('utf-8')).digest()
+    value = self.cache.get(key)
+    if value is None:
+      value = self.cache[key] = self.fn(text)
+      self.dirty = True
+      if len(self.cache) > self.size: self.cache.popitem(last=False)
+    else:
+      self.cache.move_to_end(key)
+    return value
+
+  @staticmethod
+  def fingerprint(code, h=None):
+    # bytecode alone leaves out constants such as the parser name, and names of what it calls
+    h = h or hashlib.sha1()
+    h.update(code.co_code)
+    h.update(repr(code.co_names).encode('utf-8'))
+    for const in code.co_consts:
+      if hasattr(const, 'co_code'):
+        memoize.fingerprint(const, h)
+      else:
+        h.update(repr(const).encode('utf-8'))
+    return h.hexdigest()
+
+  @property
+  def version(self):
+    # results depend on the parser stack as much as on the function itself
+    return (memoize.fingerprint(self.fn.__code__), tuple(importlib.metadata.version(lib) for lib in ['beautifulsoup4', 'markdownify', 'lxml']))
+
+  def persist(self, path):
+    self.path = path
+    try:
+      with open(path, 'rb') as f:
+        version, cache = pickle.load(f)
+      if version == self.version:
+        cache.update(self.cache)
+        self.cache = cache
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+      pass
+    atexit.register(self.save)
+
+  def save(self):
+    if not self.path or not self.dirty: return
+    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path))
+    with os.fdopen(fd, 'wb') as f:
+      pickle.dump((self.version, self.cache), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, self.path)
+    self.dirty = False
+
+@memoize
+def _clean_html(html):
   return BeautifulSoup(html, 'html.parser').prettify()
 
+def clean_html(html):
+  # plain text comes out of prettify stripped and newline-terminated
+  if not any(c in html for c in '<>&') and all(c.isprintable() or c in '\n\t' for c in html):
+    html = html.strip()
+    return html + '\n' if html else html
+  return _clean_html(html)
+
+@memoize
+def _html2md(html):
+  return md(BeautifulSoup(html, 'lxml').prettify()).strip()
+
+# a single paragraph of plain text, optionally in a Zotero note wrapper, without anything markdownify would escape
+SIMPLE_PARAGRAPH = re.compile(r'(?:<div data-schema-version="[0-9]+">)?<p>([^<>&*_`#\[\]|~\\]*)</p>(?:</div>)?')
 def html2md(html):
-  if '<' in html: html = md(BeautifulSoup(html, 'lxml').prettify())
-  return html.strip()
+  if '<' not in html: return html.strip()
+  if (simple := SIMPLE_PARAGRAPH.fullmatch(html)) and simple.group(1).isprintable():
+    return ' '.join(word for word in simple.group(1).split(' ') if word)
+  return _html2md(html)
+
+def persist_normalizations(path):
+  for memo in [_clean_html, _html2md]:
+    memo.persist(os.path.join(path, memo.__name__.strip('_') + '.pickle'))
 
 def serialize(obj):
   return json.dumps(obj, indent=2, ensure_ascii=True, sort_keys=True)
 
-def extra_lower(obj):
-  if isinstance(obj, dict) and 'items' in obj:
-    obj = copy.deepcopy(obj)
-    for item in obj['items']:
-      if 'extra' in item:
-        if type(item['extra']) == list:
-          item['extra'] = [line.lower() for line in item['extra']]
-        else:
-          item['extra'] = item['extra'].lower()
-  return obj
-
 def running(id):
   if type(id) == int:
     try:
@@ -12,9 +12,15 @@ import toml
 import urllib
 import tempfile
 from munch import *
-from steps.utils import running, nested_dict_iter, benchmark, ROOT, assert_equal_diff, serialize, html2md, clean_html, extra_lower
-from steps.library import load as Library
-from steps.bbtjsonschema import validate as validate_bbt_json
+from steps.utils import running, nested_dict_iter, benchmark, ROOT, assert_equal_diff, serialize, html2md, clean_html
+from steps.library import compare as compare_library
+from steps.compare import assert_equal_bibtex, assert_equal_entries, bibtex_entries, csl_items, serialized, stripped
+from steps.bbtjsonschema import validate as validate_bbt_json, schema as bbt_json_schema
+from steps.cache import Cache, CACHE, digest, stamp
+from steps.profile import Profile, label
+from steps.driver import Driver
+from steps.impact import DEPENDENCIES
+from steps.store import store
 import steps.utils as utils
 import shutil
 import shlex
@@ -30,6 +36,8 @@ from collections.abc import MutableMapping
 
 import sys
 import threading
+import itertools
+from contextlib import contextmanager
 import socket
 from pathlib import PurePath
 from diff_match_patch import diff_match_patch
@@ -42,6 +50,9 @@ yaml.default_flow_style = False
 
 EXPORTED = os.path.join(ROOT, 'exported')
 FIXTURES = os.path.join(ROOT, 'test/fixtures')
+IMPORTERS = { '.bib': 'Better BibTeX', '.json': 'BetterBibTeX JSON', '.yml': 'Better CSL YAML' }
+# parsed fixtures are only valid for the schema they were validated against
+SCHEMA_VERSION = digest(json.dumps(bbt_json_schema, sort_keys=True))
 
 def install_proxies(xpis, profile):
   for xpi in xpis:
@@ -78,22 +89,44 @@ def install_xpis(path, profile):
     utils.print(f'installing {xpi}')
     profile.add_extension(xpi)
 
-class Pinger():
+class Heartbeat():
+  # a single thread for the whole session that prints a dot for every `every` seconds a bridge call is outstanding
   def __init__(self, every):
     self.every = every
-
-  def __enter__(self):
-    self.stop = threading.Event()
-    threading.Timer(self.every, self.display, [time.time(), self.every, self.stop]).start()
-
-  def __exit__(self, *args):
-    self.stop.set()
-
-  def display(self, start, every, stop):
-    if stop.is_set(): return
-
-    utils.print('.', end='')
-    threading.Timer(every, self.display, [start, every, stop]).start()
+    self.calls = {}
+    self.ids = itertools.count()
+    self.wake = threading.Condition()
+    threading.Thread(target=self.run, daemon=True).start()
+
+  @contextmanager
+  def call(self, label=''):
+    id = next(self.ids)
+    with self.wake:
+      self.calls[id] = Munch(label=label, started=time.time(), ticks=0)
+      self.wake.notify()
+    try:
+      yield
+    finally:
+      with self.wake:
+        del self.calls[id]
+
+  def inflight(self):
+    now = time.time()
+    with self.wake:
+      return [(call.label, now - call.started) for call in self.calls.values()]
+
+  def run(self):
+    with self.wake:
+      while True:
+        if not self.calls:
+          self.wake.wait()
+          continue
+        self.wake.wait(timeout=1)
+        now = time.time()
+        for call in self.calls.values():
+          if now - call.started >= self.every * (call.ticks + 1):
+            call.ticks += 1
+            utils.print('.', end='')
 
 class Config:
   def __init__(self, userdata):
@@ -155,6 +188,23 @@ class Zotero:
 
     self.fixtures_loaded = set()
     self.fixtures_loaded_log = userdata.get('loaded')
+    # per-scenario fixtures and translators, for change-impact selection
+    self.scenario = None
+    self.dependencies = {}
+    self.dependencies_log = userdata.get('dependencies')
+    self.profile = Profile(userdata.get('profile'))
+    self.heartbeat = Heartbeat(20)
+    self.driver = Driver()
+    self.prefetched = {}
+    try:
+      with open(DEPENDENCIES) as f:
+        self.known_dependencies = json.load(f)
+    except FileNotFoundError:
+      self.known_dependencies = {}
+    self.fixtures = Cache('fixtures' if userdata.get('fixture_cache', 'true') == 'true' else None)
+    if self.fixtures.path: utils.persist_normalizations(CACHE)
+    # compare exports of at least this many bytes entry by entry rather than as a whole
+    self.stream_above = None if userdata.get('stream_above') == 'never' else int(userdata.get('stream_above', 8 * 1024 * 1024))
 
     self.client = userdata.get('client', 'zotero')
     self.beta = userdata.get('beta') == 'true'
@@ -201,14 +251,30 @@ class Zotero:
     for var, value in args.items():
       script = f'const {var} = {json.dumps(value)};\n' + script
 
-    with Pinger(20):
-      req = urllib.request.Request(f'http://127.0.0.1:{self.port}/debug-bridge/execute?password={self.password}', data=script.encode('utf-8'), headers={'Content-type': 'application/javascript'})
-      res = urllib.request.urlopen(req, timeout=self.config.timeout * self.config.trace_factor).read().decode()
-      return json.loads(res)
+    if not self.profile.scenario: return self.request(script)
+
+    # have the bridge time the script itself to split server-side from network time
+    started = time.time()
+    res = self.request(f'const started = Date.now();\nconst result = await (async () => {{\n{script}\n}})();\nreturn {{ result, elapsed: Date.now() - started }}')
+    elapsed = time.time() - started
+    server = res['elapsed'] / 1000
+    self.profile.event('execute', label(script), elapsed, server=server, network=max(elapsed - server, 0))
+    return res.get('result')
+
+  def request(self, script):
+    with self.heartbeat.call(label(script)):
+      res = self.driver.run(self.driver.post('127.0.0.1', self.port, f'/debug-bridge/execute?password={self.password}', script.encode('utf-8'),
+        headers={'Content-type': 'application/javascript'},
+        timeout=self.config.timeout * self.config.trace_factor
+      ))
+      return json.loads(res.decode())
 
   def shutdown(self):
     if self.proc is None: return
+    with self.profile.measure('shutdown', self.client):
+      self.stop()
 
+  def stop(self):
     # graceful shutdown
     try:
       self.execute("""
@@ -252,6 +318,10 @@ class Zotero:
     self.start()
 
   def start(self):
+    with self.profile.measure('start', self.client):
+      self.launch()
+
+  def launch(self):
     self.needs_restart = False
     profile = self.create_profile()
     shutil.rmtree(os.path.join(profile.path, self.client, 'better-bibtex'), ignore_errors=True)
@@ -313,9 +383,23 @@ class Zotero:
       self.config.reset()
       self.start()
 
+    self.scenario = scenario
+    # parse the fixtures this scenario used last time while Zotero empties the library
+    self.prefetch(scenario)
     self.execute('await Zotero.BetterBibTeX.TestSupport.reset(scenario)', scenario=scenario)
     self.preferences = Preferences(self)
 
+  def select(self, ids, settle=0.5):
+    # resolves once the selection has held for `settle` seconds
+    self.execute('await Zotero.BetterBibTeX.TestSupport.select(ids, settle)', ids=ids, settle=int(settle * 1000))
+
+  def auto_exports_done(self, seconds):
+    # long-poll in slices that stay well within the bridge timeout
+    deadline = time.time() + seconds
+    while (remaining := deadline - time.time()) > 0:
+      if self.execute('return await Zotero.BetterBibTeX.TestSupport.autoExportIdle(msecs)', msecs=int(min(remaining, 10) * 1000)): return True
+    return not self.execute('return Zotero.BetterBibTeX.TestSupport.autoExportRunning()')
+
   def reset_cache(self):
     self.execute('Zotero.BetterBibTeX.TestSupport.resetCache()')
 
@@ -325,20 +409,71 @@ class Zotero:
       with open(self.fixtures_loaded_log, 'w') as f:
         json.dump(sorted(list(self.fixtures_loaded)), f, indent='  ')
 
+  def uses(self, fixtures=[], translators=[]):
+    if self.scenario is None: return
+    used = self.dependencies.setdefault(self.scenario, Munch(fixtures=set(), translators=set()))
+    used.fixtures.update(os.path.relpath(fixture, ROOT) for fixture in fixtures if fixture)
+    used.translators.update(translators)
+    if self.dependencies_log:
+      with open(self.dependencies_log, 'w') as f:
+        json.dump({ scenario: { kind: sorted(deps) for kind, deps in used.items() } for scenario, used in sorted(self.dependencies.items()) }, f, indent='  ')
+
+  def prefetch(self, scenario):
+    # loads still queued for the previous scenario would compete with this one's; a load already parsing can't be
+    # interrupted, but it only fills the fixture cache
+    for prefetched in self.prefetched.values():
+      prefetched.cancel()
+    self.prefetched = {}
+    used = self.known_dependencies.get(scenario, {}).get('fixtures', [])
+    for fixture in used:
+      if fixture.endswith('.patch') or not fixture.startswith('test/fixtures/'): continue
+      path = os.path.join(ROOT, fixture)
+      patch = path + '.' + self.client + '.patch'
+      if not os.path.relpath(patch, ROOT) in used: patch = None
+      key = digest(path, patch, self.client)
+      if key not in self.prefetched and (os.path.exists(path) or store.packed(path)):
+        self.prefetched[key] = self.driver.spawn(self.fixture, path, patch)
+
+  def fixture(self, path, patch):
+    key = digest(path, patch, self.client)
+    version = (stamp(path), store.version(path), stamp(patch), SCHEMA_VERSION)
+    if cached := self.fixtures.get(key, version): return cached, True
+    parsed = self.parse(path, patch)
+    self.fixtures.set(key, parsed, version)
+    return parsed, False
+
   def load(self, path, attempt_patch=False):
     path = os.path.join(FIXTURES, path)
 
-    with open(path) as f:
-      if path.endswith('.json'):
-        data = json.load(f, object_pairs_hook=OrderedDict)
-      elif path.endswith('.yml'):
-        data = yaml.load(f)
-      else:
-        data = f.read()
-
     patch = path + '.' + self.client + '.patch'
+    if not attempt_patch or not os.path.exists(patch): patch = None
+
+    with self.profile.measure('fixture', os.path.relpath(path, FIXTURES)) as timing:
+      if prefetched := self.prefetched.pop(digest(path, patch, self.client), None):
+        try:
+          prefetched.result()
+        except Exception:
+          pass # parse again to raise in the step that loads it
+      (data, loaded), timing['cached'] = self.fixture(path, patch)
+
+    self.loaded(loaded)
+    self.uses(fixtures=[path, patch])
+    return (data, loaded)
 
-    if not attempt_patch or not os.path.exists(patch):
+  def parse(self, path, patch):
+    if store.packed(path):
+      data = store.load(path)
+    else:
+      with open(path) as f:
+        if path.endswith('.json'):
+          data = json.load(f, object_pairs_hook=OrderedDict)
+        elif path.endswith('.yml'):
+          # parse runs on the driver's threads, and YAML instances aren't thread-safe
+          data = YAML(typ='safe').load(f)
+        else:
+          data = f.read()
+
+    if patch is None:
       loaded = path
     else:
       for ext in ['.schomd.json', '.csl.json', os.path.splitext(path)[1]]:
@@ -357,13 +492,16 @@ class Zotero:
     if path.endswith('.json') and not (path.endswith('.csl.json') or path.endswith('.schomd.json')):
       validate_bbt_json(data)
 
-    self.loaded(loaded)
     return (data, loaded)
 
-  def exported(self, path, data=None):
+  def exported(self, path, data=None, source=None):
     path = os.path.join(EXPORTED, os.path.basename(os.path.dirname(path)), os.path.basename(path))
 
-    if data is None:
+    if source is not None:
+      os.makedirs(os.path.dirname(path), exist_ok = True)
+      shutil.copyfile(source, path)
+
+    elif data is None:
       os.remove(path)
       exdir = os.path.dirname(path)
       if len(os.listdir(exdir)) == 0:
@@ -376,16 +514,33 @@ class Zotero:
 
     return path
 
+  @contextmanager
+  def exporting(self, path, data=None, source=None):
+    # the export is written to exported/ while it is being compared, and removed again when it matches
+    written = self.driver.spawn(self.exported, path, data, source)
+    try:
+      yield
+    except BaseException:
+      # the comparison failed; the export stays for inspection, but a failure writing it must not replace that error
+      if err := written.exception(): utils.print(f'could not save export to {path}: {err}')
+      raise
+    self.exported(written.result())
+
+  def streamable(self, expected, size):
+    # `size` in bytes; only formats that can be split into entries
+    if self.stream_above is None or size < self.stream_above: return False
+    return any(expected.endswith(ext) for ext in ['.bib', '.bibtex', '.biblatex', '.csl.json'])
+
   def quick_copy(self, itemIDs, translator, expected):
+    self.uses(translators=[translator])
     found = self.execute('return await Zotero.BetterBibTeX.TestSupport.quickCopy(itemIDs, translator)',
       translator=translator,
       itemIDs=itemIDs
     )
     expected_file = expected
     expected, loaded_file = self.load(expected_file, True)
-    exported = self.exported(loaded_file, found)
-    assert_equal_diff(expected.strip(), found.strip())
-    self.exported(exported)
+    with self.exporting(loaded_file, found), self.profile.measure('compare', expected_file):
+      assert_equal_diff(expected.strip(), found.strip())
 
   def export_library(self, translator, displayOptions = {}, collection = None, output = None, expected = None, resetCache = False):
     assert not displayOptions.get('keepUpdated', False) or output # Auto-export needs a destination
@@ -395,6 +550,7 @@ class Zotero:
       translator = translator[len('id:'):]
     else:
       translator = self.translators.byName[translator].translatorID
+    self.uses(translators=[self.translators.byId[translator].label])
 
     found = self.execute('return await Zotero.BetterBibTeX.TestSupport.exportLibrary(translatorID, displayOptions, path, collection)',
       translatorID=translator,
@@ -406,39 +562,47 @@ class Zotero:
 
     if expected is None: return
 
+    expected_file = expected
+    expected, loaded_file = self.load(expected_file, True)
+
+    if self.streamable(expected_file, os.path.getsize(output) if output else len(found.encode('utf-8'))):
+      with self.exporting(loaded_file, None if output else found, output), (open(output) if output else io.StringIO(found)) as f, self.profile.measure('compare', expected_file, streamed=True):
+        if expected_file.endswith('.csl.json'):
+          assert_equal_entries(serialized(expected), serialized(csl_items(f)))
+        else:
+          assert_equal_entries(stripped(bibtex_entries(io.StringIO(expected))), stripped(bibtex_entries(f)))
+      return
+
     if output:
       with open(output) as f:
         found = f.read()
 
-    expected_file = expected
-    expected, loaded_file = self.load(expected_file, True)
-    exported = self.exported(loaded_file, found)
+    with self.exporting(loaded_file, found), self.profile.measure('compare', expected_file):
+      if expected_file.endswith('.csl.json'):
+        assert_equal_diff(json.dumps(expected, sort_keys=True, indent='  '), json.dumps(json.loads(found), sort_keys=True, indent='  '))
 
-    if expected_file.endswith('.csl.json'):
-      assert_equal_diff(json.dumps(expected, sort_keys=True, indent='  '), json.dumps(json.loads(found), sort_keys=True, indent='  '))
+      elif expected_file.endswith('.csl.yml'):
+        assert_equal_diff(serialize(expected), serialize(yaml.load(io.StringIO(found))))
 
-    elif expected_file.endswith('.csl.yml'):
-      assert_equal_diff(serialize(expected), serialize(yaml.load(io.StringIO(found))))
+      elif expected_file.endswith('.json'):
+        # TODO: clean lib and test against schema
 
-    elif expected_file.endswith('.json'):
-      # TODO: clean lib and test against schema
+        compare_library(expected, json.loads(found, object_pairs_hook=OrderedDict))
 
-      expected = Library(expected)
-      found = Library(json.loads(found, object_pairs_hook=OrderedDict))
-      assert_equal_diff(serialize(extra_lower(expected)), serialize(extra_lower(found)))
+      elif expected_file.endswith('.html'):
+        assert_equal_diff(clean_html(expected).strip(), clean_html(found).strip())
 
-    elif expected_file.endswith('.html'):
-      assert_equal_diff(clean_html(expected).strip(), clean_html(found).strip())
+      elif os.path.splitext(expected_file)[1] in ['.bib', '.bibtex', '.biblatex']:
+        assert_equal_bibtex(expected.strip(), found.strip())
 
-    else:
-      assert_equal_diff(expected.strip(), found.strip())
-
-    self.exported(exported)
+      else:
+        assert_equal_diff(expected.strip(), found.strip())
 
   def import_file(self, context, references, collection = False, items=True):
     assert type(collection) in [bool, str]
 
     data, references = self.load(references)
+    if translator := IMPORTERS.get(os.path.splitext(references)[1]): self.uses(translators=[translator])
 
     if references.endswith('.json'):
       # TODO: clean lib and test against schema
@@ -469,7 +633,12 @@ class Zotero:
       localeDateOrder = None
 
     with tempfile.TemporaryDirectory() as d:
-      if type(collection) is str:
+      if store.packed(references):
+        # only the manifest is on disk, so Zotero gets a materialised copy
+        references = os.path.join(d, collection if type(collection) is str else os.path.basename(references))
+        with open(references, 'w') as f:
+          json.dump(data, f, indent='  ')
+      elif type(collection) is str:
         orig = references
         references = os.path.join(d, collection)
         shutil.copy(orig, references)
@@ -510,7 +679,7 @@ class Zotero:
     expected = None
     for variant in ['.juris-m', '']:
       variant = os.path.join(FIXTURES, f'{base}{variant}{ext}')
-      if os.path.exists(variant): return [variant, ext]
+      if os.path.exists(variant) or store.packed(variant): return [variant, ext]
 
     return [None, None]
 
@@ -680,6 +849,7 @@ class Preferences:
       assert type(value) == self.supported[key], f'Unexpected value of type {type(value)} for preference {key}'
 
     if key == 'translators.better-bibtex.postscript':
+      self.zotero.uses(fixtures=[os.path.join(FIXTURES, value)])
       with open(os.path.join(FIXTURES, value)) as f:
         value = f.read()
 
@@ -0,0 +1,37 @@
+import os, sys
+import random
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'features'))
+from steps.balance import partition, parse_bin
+
+def check(durations, bins):
+  partitioned = partition(durations, bins)
+  assert len(partitioned) == bins
+  assert sorted(name for _bin in partitioned for name in _bin) == sorted(durations)
+  return [sum(durations[name] for name in _bin) for _bin in partitioned]
+
+def test_every_test_lands_in_one_bin():
+  for bins in [1, 2, 3, 5]:
+    check({ f't{i}': (i * 37) % 101 + 1 for i in range(40) }, bins)
+
+def test_more_bins_than_tests():
+  loads = check({ 'a': 10, 'b': 20 }, 4)
+  assert sorted(loads) == [0, 0, 10, 20]
+
+def test_perfect_split():
+  # greedy alone puts 3+3 against 2+2+2; the local search finds 6/6
+  assert check({ 'a': 3, 'b': 3, 'c': 2, 'd': 2, 'e': 2 }, 2) == [6, 6]
+
+def test_within_longest_test_of_optimum():
+  rng = random.Random(0)
+  for bins in [2, 3, 4]:
+    durations = { f't{i}': rng.randint(1, 1000) for i in range(200) }
+    loads = check(durations, bins)
+    assert max(loads) - sum(durations.values()) / bins <= max(durations.values())
+
+def test_deterministic():
+  durations = { f't{i}': i % 7 for i in range(50) }
+  assert partition(durations, 3) == partition(dict(reversed(list(durations.items()))), 3)
+
+def test_parse_bin():
+  assert parse_bin('2', 2) == (1, 2)
+  assert parse_bin('3/5', 2) == (2, 5)
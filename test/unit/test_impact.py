@@ -0,0 +1,10 @@
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'features'))
+from steps.impact import CORE
+from steps.utils import ROOT
+
+def test_core_exists():
+  # a path that doesn't exist never matches a change, so the full run it should trigger never happens
+  for path in CORE:
+    assert os.path.exists(os.path.join(ROOT, path)), path
+    assert os.path.isdir(os.path.join(ROOT, path)) == path.endswith('/'), path
@@ -0,0 +1,52 @@
+import os, sys
+import copy
+import pytest
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'features'))
+from steps.library import compare
+
+def library():
+  return {
+    'config': { 'id': 'x' },
+    'items': [
+      { 'itemID': 1, 'itemType': 'book', 'title': 'One', 'volume': 1, 'tags': [{ 'tag': 'b' }, { 'tag': 'a' }], 'dateAdded': '2020' },
+      { 'itemID': 2, 'itemType': 'book', 'title': 'Two', 'notes': ['<p>note</p>'] },
+      { 'itemID': 3, 'itemType': 'book', 'title': 'Two', 'notes': ['<p>other</p>'] },
+    ],
+    'collections': {
+      'A': { 'key': 'A', 'name': 'top', 'items': [1, 2], 'collections': ['B'] },
+      'B': { 'key': 'B', 'name': 'sub', 'parent': 'A', 'items': [3], 'collections': [] },
+    },
+  }
+
+def test_equivalent():
+  found = library()
+  # order, item IDs, config and volatile fields don't matter
+  found['items'].reverse()
+  for item in found['items']: item['itemID'] += 10
+  for coll in found['collections'].values(): coll['items'] = [itemID + 10 for itemID in coll['items']]
+  found['items'][2]['tags'].reverse()
+  found['items'][2]['dateAdded'] = '2021'
+  found['config'] = {}
+  compare(library(), found)
+
+@pytest.mark.parametrize('change, report', [
+  (lambda lib: lib['items'][0].update(volume=1.0), '"One": $.volume'),
+  (lambda lib: lib['items'][0].update(volume=True), '"One": $.volume'),
+  (lambda lib: lib['items'][1].update(notes=['<p>changed</p>']), '"Two": $.notes'),
+  (lambda lib: lib['items'].pop(0) and lib['collections']['A']['items'].remove(1), 'only in expected: "One"'),
+  (lambda lib: lib['collections']['B'].update(items=[2]), 'collections:'),
+])
+def test_differences(change, report):
+  found = library()
+  change(found)
+  with pytest.raises(AssertionError) as err:
+    compare(library(), found)
+  assert report in str(err.value)
+
+def test_duplicates():
+  expected, found = library(), library()
+  expected['items'].append({ **copy.deepcopy(expected['items'][0]), 'itemID': 4 })
+  found['items'].append({ **copy.deepcopy(found['items'][1]), 'itemID': 4 })
+  with pytest.raises(AssertionError) as err:
+    compare(expected, found)
+  assert 'duplicate items differ' in str(err.value)
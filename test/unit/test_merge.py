@@ -0,0 +1,49 @@
+import os
+import io
+import json
+import importlib.util
+
+spec = importlib.util.spec_from_file_location('merge', os.path.join(os.path.dirname(__file__), '..', '..', 'util', 'merge.py'))
+merge = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(merge)
+
+library = {
+  'config': { 'id': 'x', 'options': { 'exportNotes': True }, 'nested': [[], {}] },
+  'items': [
+    { 'itemID': 1, 'title': 'braces } ] in "strings" \\ and é', 'pages': 12345678, 'ratio': -1.5e-3 },
+    { 'itemID': 2, 'title': '', 'creators': [], 'flag': False, 'none': None },
+  ],
+  'collections': { 'K': { 'items': [1], 'collections': [] } },
+  'version': 10000000,
+}
+
+def read(text, chunk):
+  data = {}
+  for key, value in merge.Reader(io.StringIO(text), chunk).object():
+    data[key] = list(value) if key == 'items' else value
+  return data
+
+def test_reader_matches_json():
+  for text in [json.dumps(library), json.dumps(library, indent='  '), json.dumps(library, separators=(',', ':'))]:
+    # chunk sizes that split tokens and numbers at every possible point
+    for chunk in [1, 2, 3, 7, 64, 1024 * 1024]:
+      assert read(text, chunk) == library, (chunk, text[:40])
+
+def test_reader_empty():
+  assert read('{}', 1) == {}
+  assert read(' { "items" : [ ] } ', 1) == { 'items': [] }
+
+def test_reader_yields_items_one_by_one():
+  for key, value in merge.Reader(io.StringIO(json.dumps(library)), 5).object():
+    if key == 'items':
+      assert next(value)['itemID'] == 1
+      assert next(value)['itemID'] == 2
+      assert next(value, None) is None
+
+def test_reader_rejects_garbage():
+  for text in ['[]', '{"items": [1 2]}', '{"a" 1}']:
+    try:
+      read(text, 3)
+    except ValueError:
+      continue
+    raise AssertionError(text)
@@ -0,0 +1,60 @@
+import os
+import json
+import copy
+import importlib.util
+import jsonpatch
+
+spec = importlib.util.spec_from_file_location('mkpatch', os.path.join(os.path.dirname(__file__), '..', '..', 'util', 'mkpatch.py'))
+mkpatch = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(mkpatch)
+
+def library(n=10):
+  return { 'config': { 'id': 'x' }, 'items': [{ 'key': f'K{i}', 'itemType': 'book', 'title': f'title {i}', 'extra': 'x' * 100 } for i in range(n)] }
+
+def applies(source, target, patch):
+  assert jsonpatch.JsonPatch(patch).apply(copy.deepcopy(source)) == target
+
+def test_changed_items():
+  source = library()
+  target = copy.deepcopy(source)
+  target['items'][3]['title'] = 'changed'
+  target['config']['id'] = 'y'
+  patch = mkpatch.keyed_patch(source, target)
+  assert [op['path'] for op in patch] == ['/config/id', '/items/3/title']
+  applies(source, target, patch)
+
+def test_added_and_removed_items():
+  source = library()
+  target = copy.deepcopy(source)
+  del target['items'][7]
+  del target['items'][2]
+  target['items'].insert(4, { 'key': 'NEW', 'itemType': 'book', 'title': 'new' })
+  target['items'].append({ 'key': 'LAST', 'itemType': 'book', 'title': 'last' })
+  applies(source, target, mkpatch.keyed_patch(source, target))
+
+def test_removed_value_annotated():
+  source = library()
+  target = copy.deepcopy(source)
+  del target['items'][5]['extra']
+  patch = mkpatch.keyed_patch(source, target)
+  assert patch == [{ 'op': 'remove', 'path': '/items/5/extra', ':value': 'x' * 100 }]
+
+def test_unmatchable():
+  source = library()
+  reordered = copy.deepcopy(source)
+  reordered['items'].reverse()
+  rekeyed = copy.deepcopy(source)
+  for item in rekeyed['items']: item['key'] = 'R' + item['key']
+  duplicated = copy.deepcopy(source)
+  duplicated['items'][1]['key'] = 'K0'
+  for target in [reordered, rekeyed, duplicated, { 'items': {} }]:
+    assert mkpatch.keyed_patch(source, target) is None
+
+def test_smaller_of_keyed_and_plain():
+  source = library()
+  target = copy.deepcopy(source)
+  # a re-keyed item is a remove and add item by item, but a single replace in a plain diff
+  target['items'][4]['key'] = 'OTHER'
+  patch = mkpatch.keyed_patch(source, target)
+  applies(source, target, patch)
+  assert len(json.dumps(patch)) <= len(json.dumps(mkpatch.make_patch(source, target)))
@@ -0,0 +1,35 @@
+import os, sys
+import json
+import shutil
+import subprocess
+
+REBALANCE = os.path.join(os.path.dirname(__file__), '..', '..', 'util', 'rebalance.py')
+
+def scenario(name, secs):
+  return { 'type': 'scenario', 'name': name, 'status': 'passed', 'tags': [], 'steps': [{ 'result': { 'duration': secs } }] }
+
+def rebalance(cwd, *history):
+  subprocess.run([sys.executable, REBALANCE] + [f'--history={path}' for path in history] + ['refs/heads/master', 'balance.json'], cwd=cwd, check=True, capture_output=True)
+  with open(os.path.join(cwd, 'balance.json')) as f:
+    return json.load(f)
+
+def test_history_merges_once(tmp_path):
+  (tmp_path / 'logs').mkdir()
+  for job, name in [(1, 'A'), (2, 'B')]:
+    (tmp_path / 'logs' / f'behave-zotero-{job}-master.json').write_text(json.dumps([{ 'elements': [scenario(name, job)] }]))
+  (tmp_path / 'balance.json').write_text(json.dumps({ 'duration': {}, 'runs': 0, 'slow': [], 'fast': [] }))
+  (tmp_path / 'other.json').write_text(json.dumps({ 'runs': 3, 'duration': {
+    'A': { 'msecs': 5000, 'ewma': 5000, 'samples': [4000, 5000, 6000], 'runs': 3 },
+    'B': { 'msecs': 7000, 'ewma': 7000, 'samples': [7000], 'runs': 1 },
+  }}))
+
+  first = rebalance(tmp_path, 'other.json')
+  assert first['duration']['A']['runs'] == 4
+
+  again = tmp_path / 'again'
+  again.mkdir()
+  for path in ['logs', 'other.json', 'balance.json']:
+    (shutil.copytree if path == 'logs' else shutil.copy)(tmp_path / path, again / path)
+
+  # the same history a second time changes nothing beyond what the run itself adds
+  assert rebalance(tmp_path, 'other.json') == rebalance(again)
@@ -0,0 +1,40 @@
+import os, sys
+import json
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'features'))
+import steps.store
+from steps.store import Store, MANIFEST
+
+library = { 'config': { 'id': '36a3b0b5-bad0-4a04-b79b-441c7cef77db' }, 'items': [{ 'itemID': 1, 'itemType': 'book', 'title': 'Ökonomie', 'pages': '1.0' }] }
+
+def fixture(tmp_path, name, text):
+  path = tmp_path / 'export' / name
+  path.parent.mkdir(exist_ok=True)
+  path.write_text(text, encoding='utf-8')
+  return str(path)
+
+def test_canonical_round_trip(tmp_path, monkeypatch):
+  monkeypatch.setattr(steps.store, 'manifests', lambda: [str(path) for path in tmp_path.glob('*/*' + MANIFEST)])
+  text = json.dumps(library, indent='  ') + '\n\n'
+  path = fixture(tmp_path, 'canonical.json', text)
+  store = Store(str(tmp_path / 'store'))
+
+  store.write(store.add(path))
+  assert not os.path.exists(path) and os.path.exists(path + MANIFEST)
+  assert store.text(path) == text
+  store.extract(path)
+  with open(path, encoding='utf-8') as f:
+    assert f.read() == text
+
+def test_non_canonical_left_alone(tmp_path):
+  # unescaped non-ASCII, other indents and an exponent would all come back different
+  for name, text in [
+    ('unescaped.json', json.dumps(library, indent='  ', ensure_ascii=False)),
+    ('compact.json', json.dumps(library)),
+    ('indent.json', json.dumps(library, indent=4)),
+    ('exponent.json', json.dumps({ **library, 'version': 1 }, indent='  ').replace(': 1\n', ': 1e0\n')),
+  ]:
+    path = fixture(tmp_path, name, text)
+    assert Store(str(tmp_path / 'store')).add(path) is None
+    assert not os.path.exists(path + MANIFEST)
+    with open(path, encoding='utf-8') as f:
+      assert f.read() == text
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import os, sys
+import json
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--bins', type=int, default=2)
+parser.add_argument('ref')
+parser.add_argument('output')
+args = parser.parse_args()
+
+ref, output = args.ref, args.output
+if not ref.startswith('refs/heads/'):
+  print(ref, 'is not a branch')
+  sys.exit(0)
+branch = ref.split('/')[-1]
+
+print('dependencies', branch, '=>', output, f'({args.bins} bins)')
+
+# like rebalance: a run is complete when every bin left its logs and nothing failed; only complete runs may drop
+# scenarios from the index
+complete = True
+failed, passed = set(), set()
+for job in range(1, args.bins + 1):
+  log = f'logs/behave-zotero-{job}-{branch}.json'
+  try:
+    with open(log) as f:
+      for feature in json.load(f):
+        for test in feature.get('elements', []):
+          if test['type'] == 'background': continue
+          if test['status'] == 'failed': failed.add(test['name'])
+          if test['status'] == 'passed': passed.add(test['name'])
+  except (FileNotFoundError, json.JSONDecodeError) as err:
+    print('skipping', log, err)
+    complete = False
+# a retried scenario that passed in the end used everything it needs
+failed -= passed
+if failed: complete = False
+
+# scenario => fixtures and translators it used, merged over the test bins
+found = {}
+for job in range(1, args.bins + 1):
+  job = f'logs/dependencies-zotero-{job}-{branch}.json'
+  try:
+    with open(job) as f:
+      for scenario, used in json.load(f).items():
+        merged = found.setdefault(scenario, {})
+        for kind, deps in used.items():
+          merged[kind] = sorted(set(merged.get(kind, []) + deps))
+  except (FileNotFoundError, json.JSONDecodeError) as err:
+    print('skipping', job, err)
+    complete = False
+if not found:
+  print('no dependencies logged')
+  sys.exit(0)
+
+try:
+  with open(output) as f:
+    dependencies = json.load(f)
+except FileNotFoundError:
+  dependencies = {}
+
+if complete:
+  print('complete run, dropping scenarios that did not run')
+  dependencies = {}
+for scenario, used in found.items():
+  # a failed scenario may have stopped before loading everything it uses, so it only adds to what was known
+  if scenario in failed:
+    for kind, deps in dependencies.get(scenario, {}).items():
+      used[kind] = sorted(set(used.get(kind, []) + deps))
+  dependencies[scenario] = used
+print(len(found), 'scenarios logged,', len(failed), 'failed,', len(dependencies), 'indexed')
+
+with open(output, 'w') as f:
+  json.dump(dict(sorted(dependencies.items())), f, indent='  ')
+print(f"::set-output name=dependencies::{output}")
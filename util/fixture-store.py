@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+# Moves BBT JSON fixtures in and out of the content-addressed store in test/fixtures/store: `pack` replaces fixtures by
+# manifests and adds their items to the pack, `unpack` puts them back, `status` shows what packing saves. Unpack a
+# fixture before editing it.
+
+import os
+import sys
+import json
+import glob
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'test', 'features'))
+from steps.store import store, manifests, MANIFEST, FIXTURES
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--zstd', action='store_true', help='compress the pack with zstd rather than gzip (needs the zstandard module)')
+parser.add_argument('--min-size', type=int, default=1024 * 1024, help='pack fixtures from this size when none are named')
+parser.add_argument('command', choices=['pack', 'unpack', 'status'])
+parser.add_argument('fixtures', nargs='*')
+args = parser.parse_args()
+
+def packable(path):
+  if not path.endswith('.json') or path.endswith('.csl.json') or path.endswith('.schomd.json'): return False
+  with open(path) as f:
+    data = json.load(f)
+  if type(data) != dict or type(data.get('items')) != list: return False
+  # attachments are resolved relative to the fixture, which a materialised copy doesn't have
+  return not any(att.get('path') for item in data['items'] for att in item.get('attachments') or [])
+
+def size(path):
+  return os.path.getsize(path) if os.path.exists(path) else 0
+
+fixtures = [os.path.abspath(fixture[:-len(MANIFEST)] if fixture.endswith(MANIFEST) else fixture) for fixture in args.fixtures]
+
+if args.command == 'pack':
+  if not fixtures:
+    fixtures = [fixture for fixture in glob.glob(os.path.join(FIXTURES, '*', '*.json')) if size(fixture) >= args.min_size]
+  items = dict(store.read())
+  before = sum(size(fixture) for fixture in fixtures) + size(store.pack())
+  packed = 0
+  for fixture in sorted(fixtures):
+    if not packable(fixture):
+      print('skipped', os.path.relpath(fixture, FIXTURES))
+      continue
+    if (added := store.add(fixture)) is None:
+      print('not packed, does not round-trip:', os.path.relpath(fixture, FIXTURES))
+      continue
+    items.update(added)
+    packed += 1
+  unique = store.write(items, 'zst' if args.zstd else 'gz')
+  after = sum(size(fixture) + size(fixture + MANIFEST) for fixture in fixtures) + size(store.pack())
+  print(f'packed {packed} fixtures, {unique} distinct items: {before / 1024 / 1024:.1f}MB => {after / 1024 / 1024:.1f}MB')
+
+elif args.command == 'unpack':
+  if not fixtures:
+    fixtures = [manifest[:-len(MANIFEST)] for manifest in manifests()]
+  for fixture in sorted(fixtures):
+    store.extract(fixture)
+    print('unpacked', os.path.relpath(fixture, FIXTURES))
+  store.write(dict(store.read()), 'zst' if store.pack().endswith('.zst') else 'gz')
+
+else:
+  referenced = 0
+  for manifest in sorted(manifests()):
+    with open(manifest) as f:
+      n = len(json.load(f)['items'])
+    referenced += n
+    print(f'{n:7d} items {os.path.relpath(manifest[:-len(MANIFEST)], FIXTURES)}')
+  print(f'{referenced} items in {len(manifests())} manifests, {len(store.read())} distinct in {os.path.relpath(store.pack(), FIXTURES)} ({size(store.pack()) / 1024 / 1024:.1f}MB)')
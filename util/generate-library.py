@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+# Generates a synthetic BBT JSON library of any size for scaling tests. Item types, their fields and creator types come
+# from schema/<client>.json, restricted to what gen/items/<client>.schema allows when it has been built. With --like,
+# the item type mix, field fill rates and creator/tag/note/attachment counts are taken from an existing library
+# instead of the defaults. The same seed always gives the same library.
+
+import os
+import sys
+import json
+import math
+import random
+import string
+import argparse
+import collections
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT, 'test', 'features'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from merge import indented
+
+def count(value):
+  value = value.lower()
+  scale = { 'k': 1000, 'm': 1000000 }.get(value[-1], 1)
+  return int(float(value.rstrip('km')) * scale)
+
+parser = argparse.ArgumentParser(description='generate a synthetic BBT JSON library')
+parser.add_argument('items', type=count, help='number of items, e.g. 10k, 100k, 1m')
+parser.add_argument('-o', '--output', help='defaults to test/fixtures/export/Synthetic <items>.json')
+parser.add_argument('--client', default='zotero', choices=['zotero', 'jurism'])
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--like', help='take distributions from this BBT JSON library')
+parser.add_argument('--fields', type=float, default=0.4, help='chance an optional field is filled')
+parser.add_argument('--creators', type=float, default=2.0, help='mean number of creators per item')
+parser.add_argument('--tags', type=float, default=1.5, help='mean number of tags per item')
+parser.add_argument('--notes', type=float, default=0.1, help='mean number of notes per item')
+parser.add_argument('--attachments', type=float, default=0.2, help='mean number of attachments per item')
+parser.add_argument('--collections', type=int, default=None, help='number of collections, defaults to items / 50')
+parser.add_argument('--depth', type=int, default=4, help='maximum collection nesting')
+parser.add_argument('--in-collection', type=float, default=0.5, help='chance an item is in a collection')
+parser.add_argument('--no-validate', dest='validate', action='store_false')
+args = parser.parse_args()
+
+output = args.output or os.path.join(ROOT, 'test/fixtures/export', f'Synthetic {args.items}.json')
+rng = random.Random(args.seed)
+
+with open(os.path.join(ROOT, 'schema', f'{args.client}.json')) as f:
+  schema = json.load(f)
+# fields of type date get dates
+dates = set(field for field, meta in schema['meta']['fields'].items() if meta['type'] == 'date')
+
+valid = None
+if os.path.exists(table := os.path.join(ROOT, 'gen/items', f'{args.client}.schema')):
+  with open(table) as f:
+    valid = { itemType['properties']['itemType']['const']: set(itemType['properties']) for itemType in json.load(f)['oneOf'] }
+
+itemTypes = {}
+for itemType in schema['itemTypes']:
+  if itemType['itemType'] in ['annotation', 'attachment', 'note']: continue
+  # BBT JSON uses base field names
+  fields = [field.get('baseField', field['field']) for field in itemType['fields'] if valid is None or field['field'] in valid.get(itemType['itemType'], [])]
+  if valid is not None and itemType['itemType'] not in valid: continue
+  itemTypes[itemType['itemType']] = {
+    'fields': { field: args.fields for field in fields if field != 'title' },
+    'creatorTypes': [creator['creatorType'] for creator in sorted(itemType['creatorTypes'], key=lambda creator: not creator.get('primary'))],
+  }
+
+rate = { 'creators': args.creators, 'tags': args.tags, 'notes': args.notes, 'attachments': args.attachments }
+weights = { itemType: 1 for itemType in itemTypes }
+
+if args.like:
+  with open(args.like) as f:
+    like = json.load(f)['items']
+  like = [item for item in like if item['itemType'] in itemTypes]
+  weights = collections.Counter(item['itemType'] for item in like)
+  for itemType, n in weights.items():
+    seen = collections.Counter(field for item in like if item['itemType'] == itemType for field in item)
+    itemTypes[itemType]['fields'] = { field: seen[field] / n for field in itemTypes[itemType]['fields'] }
+  for kind in rate:
+    rate[kind] = sum(len(item.get(kind) or []) for item in like) / len(like)
+
+# a shared vocabulary, so tags and names repeat the way they do in real libraries
+def word(length=None):
+  return ''.join(rng.choice('bcdfghjklmnprstvwz') + rng.choice('aeiou') for _ in range(length or rng.randint(2, 4)))
+vocabulary = [word() for _ in range(5000)]
+surnames = [word().capitalize() for _ in range(max(100, int(math.sqrt(args.items) * 20)))]
+givennames = [word(rng.randint(2, 3)).capitalize() for _ in range(500)]
+tags = [' '.join(word() for _ in range(rng.randint(1, 2))) for _ in range(max(50, int(math.sqrt(args.items) * 5)))]
+
+def zipf(population, skew=2):
+  # favours the head of the list
+  return population[int(len(population) * rng.random() ** skew)]
+
+def poisson(mean):
+  # Knuth, for the small means used here
+  limit, n, p = math.exp(-mean), 0, rng.random()
+  while p > limit:
+    n += 1
+    p *= rng.random()
+  return n
+
+def text(words):
+  return ' '.join(zipf(vocabulary) for _ in range(words))
+
+def date():
+  return f'{rng.randint(1900, 2023)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}'
+
+def timestamp():
+  return f'{date()}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}Z'
+
+def key():
+  return ''.join(rng.choice(string.ascii_uppercase + string.digits) for _ in range(8))
+
+def value(field):
+  if field in dates: return date()
+  if field == 'extra': return [f'{word()}: {word()}' for _ in range(rng.randint(1, 2))]
+  if field == 'url': return f'https://{word()}.org/{word()}/{rng.randint(1, 99999)}'
+  if field == 'DOI': return f'10.{rng.randint(1000, 9999)}/{word()}.{rng.randint(1, 99999)}'
+  if field == 'ISBN': return ''.join(rng.choice(string.digits) for _ in range(13))
+  if field == 'ISSN': return f'{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}'
+  if field == 'pages': return f'{(first := rng.randint(1, 900))}-{first + rng.randint(1, 40)}'
+  if field in ['volume', 'issue', 'edition', 'numPages', 'seriesNumber', 'numberOfVolumes']: return str(rng.randint(1, 500))
+  if field == 'language': return rng.choice(['en', 'de', 'fr', 'nl', 'ja', 'zh'])
+  if field == 'abstractNote': return text(rng.randint(20, 120)).capitalize() + '.'
+  return text(rng.randint(1, 6)).capitalize()
+
+def creator(creatorTypes):
+  creatorType = creatorTypes[0] if rng.random() < 0.8 or len(creatorTypes) == 1 else rng.choice(creatorTypes[1:])
+  if rng.random() < 0.05: return { 'creatorType': creatorType, 'name': text(3).title() }
+  return { 'creatorType': creatorType, 'firstName': rng.choice(givennames), 'lastName': zipf(surnames) }
+
+def item(itemID):
+  itemType = rng.choices(list(weights.keys()), list(weights.values()))[0]
+  spec = itemTypes[itemType]
+  item = { 'itemID': itemID, 'itemType': itemType, 'key': key(), 'title': value('title') }
+  for field, fill in spec['fields'].items():
+    if rng.random() < fill: item[field] = value(field)
+  if spec['creatorTypes'] and (n := poisson(rate['creators'])):
+    item['creators'] = [creator(spec['creatorTypes']) for _ in range(n)]
+  if n := poisson(rate['tags']):
+    item['tags'] = [{ 'tag': tag } if rng.random() < 0.9 else { 'tag': tag, 'type': 1 } for tag in dict.fromkeys(zipf(tags) for _ in range(n))]
+  if n := poisson(rate['notes']):
+    item['notes'] = [f'<p>{text(rng.randint(5, 80))}</p>' for _ in range(n)]
+  if n := poisson(rate['attachments']):
+    # linked URLs only, since imports insist that attached files exist
+    item['attachments'] = [{ 'title': value('title'), 'url': value('url'), 'linkMode': 'linked_url', 'contentType': 'text/html' } for _ in range(n)]
+  item['dateAdded'] = item['dateModified'] = timestamp()
+  return item
+
+# collection tree, filled breadth-first up to the maximum depth
+ncollections = args.collections if args.collections is not None else max(1, args.items // 50)
+library = collections.OrderedDict()
+for n in range(ncollections):
+  coll = collections.OrderedDict(collections=[], items=[], key=f'coll:{n:05d}', name=text(rng.randint(1, 3)).capitalize())
+  parents = [parent for parent in library.values() if parent['depth'] < args.depth - 1]
+  if library and parents and rng.random() < 0.7:
+    parent = rng.choice(parents)
+    parent['collections'].append(coll['key'])
+    coll['parent'] = parent['key']
+    coll['depth'] = parent['depth'] + 1
+  else:
+    coll['depth'] = 0
+  library[coll['key']] = coll
+for coll in library.values():
+  del coll['depth']
+
+config = collections.OrderedDict(id='36a3b0b5-bad0-4a04-b79b-441c7cef77db', label='BetterBibTeX JSON', localeDateOrder='ymd', options={}, preferences={})
+
+validate = None
+if args.validate:
+  import jsonschema
+  from steps.bbtjsonschema import schema as bbtjsonschema
+  jsonschema.validate(instance={ 'config': config, 'items': [], 'collections': library }, schema=bbtjsonschema)
+  validate = jsonschema.validators.validator_for(bbtjsonschema)(bbtjsonschema['properties']['items']['items']).validate
+
+print(f'generating {args.items} {args.client} items in {ncollections} collections => {output}')
+keys = list(library.keys())
+with open(output, 'w') as f:
+  f.write(f'{{\n  "config": {indented(config, 1)},\n  "items": [')
+  for itemID in range(1, args.items + 1):
+    _item = item(itemID)
+    if validate: validate(_item)
+    if keys and rng.random() < args.in_collection:
+      library[zipf(keys)]['items'].append(itemID)
+    f.write(('\n' if itemID == 1 else ',\n') + '    ' + indented(_item, 2))
+    if itemID % 10000 == 0: print(' ', itemID)
+  f.write('\n  ]' if args.items else ']')
+  if library: f.write(f',\n  "collections": {indented(library, 1)}')
+  f.write('\n}\n')
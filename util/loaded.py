@@ -2,24 +2,155 @@
 
 import os, sys
 import json
+import csv
+import re
+import glob
+import argparse
 
-ref, output = sys.argv[1:]
+parser = argparse.ArgumentParser()
+parser.add_argument('--bins', type=int, default=2)
+parser.add_argument('--index', help='write a fixture usage index here')
+parser.add_argument('--profile', action='append', default=[], help='profile directories (--profile runs) to take load times from')
+parser.add_argument('--dependencies', default='test/dependencies.json')
+parser.add_argument('--prune', action='store_true', help='list fixtures no scenario uses')
+parser.add_argument('--top', type=int, default=20)
+parser.add_argument('ref')
+parser.add_argument('output')
+args = parser.parse_args()
+analyse = args.index or args.prune
+
+ref, output = args.ref, args.output
 if not ref.startswith('refs/heads/'):
   print(ref, 'is not a branch')
   sys.exit(0)
 branch = ref.split('/')[-1]
 
-print('loaded', branch, '=>', output)
+print('loaded', branch, '=>', output, f'({args.bins} bins)')
 
 loaded = []
-for job in [1, 2]:
+for job in range(1, args.bins + 1):
   job = f'logs/loaded-zotero-{job}-{branch}.json'
   if not os.path.exists(job):
     print('not found:', job)
-    sys.exit(0)
+    if not analyse: sys.exit(0)
+    loaded = None
+    break
   with open(job) as f:
     loaded += json.load(f)
 
-with open(output, 'w') as f:
-  json.dump(sorted(set(loaded)), f, indent='  ')
-print(f"::set-output name=loaded::{output}")
+if loaded is not None:
+  with open(output, 'w') as f:
+    json.dump(sorted(set(loaded)), f, indent='  ')
+  print(f"::set-output name=loaded::{output}")
+elif os.path.exists(output):
+  # analyse the last committed state instead
+  with open(output) as f:
+    loaded = json.load(f)
+else:
+  loaded = []
+
+if not analyse: sys.exit(0)
+
+FIXTURES = 'test/fixtures'
+SUITES = ['export', 'import', 'merge']
+STORE = '.store'
+
+def fixture(path):
+  return os.path.relpath(path, FIXTURES)
+
+def size(path):
+  for candidate in [path, path + STORE]:
+    if os.path.exists(os.path.join(FIXTURES, candidate)): return os.path.getsize(os.path.join(FIXTURES, candidate))
+  return 0
+
+def stem(path):
+  # the name features refer to a fixture by
+  name = os.path.basename(path)
+  for ext in ['.zotero.patch', '.jurism.patch', STORE]:
+    if name.endswith(ext): name = name[:-len(ext)]
+  for ext in ['.schomd.json', '.csl.json', '.csl.yml', '.juris-m.json', '.jurism.json']:
+    if name.endswith(ext): return name[:-len(ext)]
+  return os.path.splitext(name)[0]
+
+index = {}
+def entry(path):
+  return index.setdefault(path, { 'size': size(path), 'scenarios': [], 'loaded': False, 'loads': 0, 'secs': 0.0, 'parse': None, 'cached': None })
+
+# scenario => fixtures, from the dependency logs
+if os.path.exists(args.dependencies):
+  with open(args.dependencies) as f:
+    for scenario, used in json.load(f).items():
+      for path in used.get('fixtures', []):
+        if path.startswith(FIXTURES + '/'): entry(fixture(path))['scenarios'].append(scenario)
+else:
+  print('not found:', args.dependencies)
+
+for path in loaded:
+  entry(path)['loaded'] = True
+
+# load times, cached and not, from profile traces
+timings = {}
+for profile in args.profile:
+  for trace in glob.glob(os.path.join(profile, '**', 'trace.csv'), recursive=True):
+    with open(trace, newline='') as f:
+      for row in csv.DictReader(f):
+        if row['kind'] != 'fixture': continue
+        details = json.loads(row['details']) if row['details'] else {}
+        timings.setdefault(row['name'], { True: [], False: [] })[bool(details.get('cached'))].append(float(row['secs']))
+for path, secs in timings.items():
+  used = entry(path)
+  used['loads'] = len(secs[True]) + len(secs[False])
+  used['secs'] = sum(secs[True]) + sum(secs[False])
+  if secs[False]: used['parse'] = sum(secs[False]) / len(secs[False])
+  if secs[True]: used['cached'] = sum(secs[True]) / len(secs[True])
+
+for used in index.values():
+  used['scenarios'] = sorted(set(used['scenarios']))
+
+if args.index:
+  with open(args.index, 'w') as f:
+    json.dump(dict(sorted(index.items())), f, indent='  ')
+  print('index =>', args.index)
+
+def mb(n):
+  return f'{n / 1024 / 1024:7.2f}MB'
+
+def kb(n):
+  return f'{n / 1024:8.1f}KB'
+
+print(f'\nlargest fixtures in use:')
+for path, used in sorted(index.items(), key=lambda kv: kv[1]['size'], reverse=True)[:args.top]:
+  print(f'  {mb(used["size"])} {len(used["scenarios"]):4d} scenarios  {path}')
+
+if timings:
+  print(f'\nmost time spent loading:')
+  for path, used in sorted([kv for kv in index.items() if kv[1]['loads']], key=lambda kv: kv[1]['secs'], reverse=True)[:args.top]:
+    parse = f'{used["parse"]:.2f}s' if used['parse'] is not None else '-'
+    print(f'  {used["secs"]:7.2f}s {used["loads"]:4d} loads, parse {parse:>6}  {path}')
+
+if args.prune:
+  # anything a feature names could be used by a scenario that didn't run, so only unnamed fixtures are candidates
+  features = ''
+  for feature in glob.glob('test/features/*.feature'):
+    with open(feature) as f:
+      features += f.read()
+  # "import/*-pre.json" in a step refers to "<scenario title>-pre.json"
+  titles = set(re.findall(r'^\s*Scenario(?: Outline)?:\s*(.+?)\s*$', features, re.MULTILINE))
+  def mentioned(path):
+    name = os.path.basename(path)
+    if name.endswith(STORE): name = name[:-len(STORE)]
+    return stem(path) in features or any(name.startswith(title) and f'*{name[len(title):]}"' in features for title in titles)
+
+  named, unused = [], []
+  for suite in SUITES:
+    for path in sorted(glob.glob(os.path.join(FIXTURES, suite, '*'))):
+      if not os.path.isfile(path): continue
+      path = fixture(path)
+      if path.endswith(STORE): path = path[:-len(STORE)]
+      if path in index or os.path.basename(path) == 'README.md': continue
+      (named if mentioned(path) else unused).append(path)
+
+  print(f'\n{len(named)} fixtures not used by any indexed scenario but named in a feature ({mb(sum(size(path) for path in named)).strip()})')
+  print(f'{len(unused)} fixtures no feature refers to ({mb(sum(size(path) for path in unused)).strip()}):')
+  for path in unused:
+    print(f'  {kb(size(path))}  {path}')
@@ -1,47 +1,201 @@
 #!/usr/bin/env python3
 
 import json
-import sys
+import sys, os
+import re
+import hashlib
 import argparse
+import tempfile
+import shutil
 
 parser = argparse.ArgumentParser()
 parser.add_argument('-c', '--config', action='store_true')
 parser.add_argument('-u', '--unique', action='store_true')
+parser.add_argument('-o', '--output', help='write the merged library here rather than over the first library')
 parser.add_argument('libraries', type=str, nargs='+')
-args = parser.parse_args()
 
-main = args.libraries.pop(0)
+class Reader:
+  # incremental parser for a JSON object whose `items` array is yielded item by item, so only one item needs to be in
+  # memory at a time
+  whitespace = re.compile(r'\s*')
+  decoder = json.JSONDecoder()
 
-with open(main) as f:
-  data = json.load(f)
+  def __init__(self, f, chunk=1024 * 1024):
+    self.f = f
+    self.chunk = chunk
+    self.buffer = ''
+    self.pos = 0
+    self.eof = False
 
-jurisM = main.endswith('.juris-m.json')
+  def fill(self):
+    data = self.f.read(self.chunk)
+    self.eof = not data
+    self.buffer = self.buffer[self.pos:] + data
+    self.pos = 0
 
-for lib in args.libraries:
-  if lib.endswith('.schomd.json'): continue
-  if lib.endswith('.csl.json') or lib.endswith('.csl.juris-m.json'): continue
-  if not jurisM and lib.endswith('.jurism.json'): continue
-  print(lib)
+  def peek(self):
+    while True:
+      self.pos = self.whitespace.match(self.buffer, self.pos).end()
+      if self.pos < len(self.buffer) or self.eof: return self.buffer[self.pos:self.pos + 1]
+      self.fill()
 
-  with open(lib) as f:
-    lib = json.load(f)
+  def expect(self, c):
+    if self.peek() != c: raise ValueError(f'expected {json.dumps(c)} at {json.dumps(self.buffer[self.pos:self.pos + 20])}')
+    self.pos += 1
 
-  if args.config and 'config' in lib:
-    data['config'] = lib['config']
+  def separator(self, close):
+    if self.peek() == ',':
+      self.pos += 1
+    elif self.peek() != close:
+      self.expect(close)
 
-  if 'items' in lib:
-    data['items'] = data['items'] + lib['items']
+  def value(self):
+    self.peek()
+    while True:
+      try:
+        value, end = self.decoder.raw_decode(self.buffer, self.pos)
+        # a number at the end of the buffer may continue in the next chunk
+        if end < len(self.buffer) or self.eof:
+          self.pos = end
+          return value
+      except json.JSONDecodeError:
+        if self.eof: raise
+      self.fill()
 
-if args.unique:
-  data['items'] = [json.loads(item) for item in set([json.dumps(item, sort_keys=True) for item in data['items']])]
+  def array(self):
+    self.expect('[')
+    while self.peek() != ']':
+      yield self.value()
+      self.separator(']')
+    self.expect(']')
 
-print(len(data['items']))
+  def object(self):
+    # the `items` value is a generator that must be exhausted before the next key is read
+    self.expect('{')
+    while self.peek() != '}':
+      key = self.value()
+      self.expect(':')
+      yield key, (self.array() if key == 'items' else self.value())
+      self.separator('}')
+    self.expect('}')
 
-print('saving', main)
-with open(main, 'w') as f:
-  json.dump(data, f, indent='  ')
+def library(path):
+  with open(path) as f:
+    yield from Reader(f).object()
 
-with open(main) as f:
-  data = json.load(f)
-  print(len(data['items']))
+def header(path):
+  # the top-level keys that precede the items, which is where BBT puts config and collections
+  data = {}
+  for key, value in library(path):
+    if key == 'items': break
+    data[key] = value
+  return data
 
+def toplevel(path):
+  # every key but the items, which are read past without being kept
+  data = {}
+  for key, value in library(path):
+    if key == 'items':
+      for _ in value: pass
+    else:
+      data[key] = value
+  return data
+
+def fingerprint(item):
+  item = { k: v for k, v in item.items() if k != 'itemID' }
+  return hashlib.sha1(json.dumps(item, sort_keys=True).encode('utf-8')).digest()
+
+def indented(value, depth):
+  return json.dumps(value, indent='  ').replace('\n', '\n' + '  ' * depth)
+
+def main():
+  args = parser.parse_args()
+
+  base = args.libraries[0]
+  jurisM = base.endswith('.juris-m.json')
+
+  libraries = [base]
+  for lib in args.libraries[1:]:
+    if lib.endswith('.schomd.json'): continue
+    if lib.endswith('.csl.json') or lib.endswith('.csl.juris-m.json'): continue
+    if not jurisM and lib.endswith('.jurism.json'): continue
+    libraries.append(lib)
+
+  # top-level keys other than the items and collections are taken from the first library unchanged
+  kept = toplevel(base)
+  config = kept.get('config')
+  for lib in libraries[1:]:
+    lib = header(lib)
+    if 'config' in lib and (config is None or args.config):
+      config = lib['config']
+
+  output = args.output or base
+  out = tempfile.NamedTemporaryFile('w', dir=os.path.dirname(os.path.abspath(output)), delete=False)
+
+  collections = {}
+  seen = {}
+  itemIDs = set()
+  nextID = 1
+  count = 0
+  try:
+    print('{', file=out)
+    if config is not None:
+      print(f'  "config": {indented(config, 1)},', file=out)
+    for key, value in kept.items():
+      if key not in ['config', 'collections']: print(f'  {json.dumps(key)}: {indented(value, 1)},', file=out)
+    out.write('  "items": [')
+
+    for lib in libraries:
+      if lib != base: print(lib)
+
+      # item IDs from later libraries are renumbered when they clash or are dropped as duplicates
+      remap = {}
+      _collections = {}
+      for key, value in library(lib):
+        if key == 'collections':
+          _collections = value
+        elif key == 'items':
+          for item in value:
+            if args.unique:
+              hashed = fingerprint(item)
+              if hashed in seen:
+                if 'itemID' in item: remap[item['itemID']] = seen[hashed]
+                continue
+
+            if 'itemID' in item:
+              itemID = item['itemID']
+              if itemID in itemIDs:
+                while nextID in itemIDs: nextID += 1
+                item['itemID'] = remap[itemID] = nextID
+              itemIDs.add(item['itemID'])
+
+            if args.unique: seen[hashed] = item.get('itemID')
+            out.write(('\n' if count == 0 else ',\n') + '    ' + indented(item, 2))
+            count += 1
+
+      for key, coll in _collections.items():
+        coll = { **coll, 'items': [remap.get(itemID, itemID) for itemID in coll.get('items', [])] }
+        if key in collections:
+          merged = collections[key]
+          merged['items'] += [itemID for itemID in coll['items'] if itemID not in merged['items']]
+          children = merged.setdefault('collections', [])
+          children += [child for child in coll.get('collections', []) if child not in children]
+        else:
+          collections[key] = coll
+
+    out.write('\n  ]' if count else ']')
+    if collections: out.write(f',\n  "collections": {indented(collections, 1)}')
+    out.write('\n}')
+    out.close()
+    print(count)
+
+    print('saving', output)
+    if os.path.exists(output): shutil.copymode(output, out.name)
+    os.replace(out.name, output)
+  except:
+    out.close()
+    os.remove(out.name)
+    raise
+
+if __name__ == '__main__':
+  main()
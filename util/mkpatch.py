@@ -1,13 +1,21 @@
 #!/usr/bin/env python3
 
-from functools import reduce
 from diff_match_patch import diff_match_patch
+import argparse
 import glob
 import os, sys
-import json, jsonpatch, jsonpath_ng as jsonpath
-from urllib.parse import unquote
+import json, jsonpatch
+from jsonpointer import resolve_pointer
 import shlex
 from copy import deepcopy
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'test', 'features'))
+from steps.store import store, MANIFEST
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--full', action='store_true', help='diff JSON fixtures as a whole rather than item by item')
+parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count())
 
 def sort(schema):
   schema['itemTypes'] = sorted(schema['itemTypes'], key=lambda it: it['itemType'])
@@ -24,73 +32,121 @@ def get_ext(filename):
   if len(parts) > 2 and parts[-2] in ['schomd', 'csl']: return '.'.join(parts[-2:])
   return parts[-1]
 
-def patch2path(_patch):
-  assert _patch[0] == '/', _patch
-  _path = '$'
-  for p in _patch[1:].split('/'):
-    try:
-      _path += f'[{int(p)}]'
-    except:
-      _path += f'.{p}'
-  return _path
-
-patches = []
-for target in glob.glob('test/fixtures/*/*.*'):
-  ext = get_ext(target)
-  if ext.startswith('juris-m.'):
-    source = target[:-len(ext)] + ext.replace('juris-m.', '')
-  elif ext.startswith('jurism.'):
-    source = target[:-len(ext)] + ext.replace('jurism.', '')
-  else:
-    continue
+def annotate(doc, ops, prefix=''):
+  # add dummy value for legibility. `doc` is patched in place as we go, so every op is resolved against the document
+  # as it stands at that point
+  for op in ops:
+    if op['op'] in ['move', 'remove'] and not 'value' in op:
+      value = resolve_pointer(doc, op['from'] if op['op'] == 'move' else op['path'], None)
+      assert value is not None, op
+    else:
+      value = None
 
-  print(target)
-  with open(source) as f:
-    _source = f.read()
-  with open(target) as f:
-    _target = f.read()
+    # copy the value so later ops don't modify the patch through the document
+    jsonpatch.JsonPatch([{**op, 'value': deepcopy(op['value'])} if 'value' in op else op]).apply(doc, in_place=True)
 
-  if ext.endswith('.json'):
-    _progress = json.loads(_source)
-    _source = json.loads(_source)
-    _target = json.loads(_target)
-    diff = json.loads(str(jsonpatch.make_patch(_source, _target)))
-    # add dummy value for legibility
-    for op in diff:
-      if op['op'] == 'move' and not 'value' in op:
-        value = next((x.value for x in jsonpath.parse(patch2path(op['from'])).find(_progress)), None)
-        assert value is not None, op
-      elif op['op'] == 'remove' and not 'value' in op:
-        value = next((x.value for x in jsonpath.parse(patch2path(op['path'])).find(_progress)), None)
-        assert value is not None, op
-      else:
-        value = None
+    if not value is None:
+      op[':value'] = value
+    for path in ['path', 'from']:
+      if path in op: op[path] = prefix + op[path]
+  return ops
+
+def make_patch(source, target, prefix=''):
+  return annotate(deepcopy(source), json.loads(str(jsonpatch.make_patch(source, target))), prefix)
+
+def item_key(item):
+  return item.get('key', item.get('itemKey', item.get('itemID')))
+
+# share of items that must keep their key for an item-by-item patch
+OVERLAP = 0.5
+
+def keyed_patch(source, target):
+  # patch items matched by key one at a time; None when the items can't be matched up
+  if type(source) != dict or type(target) != dict or type(source.get('items')) != list or type(target.get('items')) != list: return None
+  source_keys = [item_key(item) for item in source['items']]
+  target_keys = [item_key(item) for item in target['items']]
+  for keys in [source_keys, target_keys]:
+    if None in keys or len(set(keys)) != len(keys): return None
+  common = set(source_keys) & set(target_keys)
+  # with few items in common (a re-keyed fixture, say) it would remove and add nearly everything
+  if len(common) < OVERLAP * max(len(source_keys), len(target_keys)): return None
+  kept = [key for key in source_keys if key in common]
+  if kept != [key for key in target_keys if key in common]: return None # reordered
+
+  patch = make_patch({ k: v for k, v in source.items() if k != 'items' }, { k: v for k, v in target.items() if k != 'items' })
 
-      _progress = jsonpatch.apply_patch(_progress, [op])
+  for i in reversed(range(len(source_keys))):
+    if source_keys[i] not in common:
+      patch.append({ 'op': 'remove', 'path': f'/items/{i}', ':value': source['items'][i] })
 
-      if not value is None:
-        op[':value'] = value
+  source_items = dict(zip(source_keys, source['items']))
+  target_items = dict(zip(target_keys, target['items']))
+  for i, key in enumerate(kept):
+    patch += make_patch(source_items[key], target_items[key], f'/items/{i}')
 
-    diff = json.dumps(diff, indent='  ')
+  # in target order, so every insert lands on its final position
+  for i, key in enumerate(target_keys):
+    if key not in common:
+      patch.append({ 'op': 'add', 'path': f'/items/{i}', 'value': target['items'][i] })
+
+  if len(kept) < max(len(source_keys), len(target_keys)):
+    # items were removed or added whole, which a plain diff may express in less
+    patch = min([patch, make_patch(source, target)], key=lambda patch: len(json.dumps(patch)))
+  return patch
+
+def diff(source, target, ext, full):
+  _source = store.text(source)
+  _target = store.text(target)
+
+  if ext.endswith('.json'):
+    _source = json.loads(_source)
+    _target = json.loads(_target)
+    patch = None if full else keyed_patch(_source, _target)
+    if patch is None: patch = make_patch(_source, _target)
+    return json.dumps(patch, indent='  ')
   else:
     dmp = diff_match_patch()
     patch = dmp.patch_make(_source, _target)
-    diff = dmp.patch_toText(patch)
+    return dmp.patch_toText(patch)
 
-  patch = source + '.jurism.patch'
-  patches.append(shlex.quote(patch))
+def main():
+  args = parser.parse_args()
 
-  if os.path.exists(patch):
-    with open(patch) as f:
-      if f.read() != diff:
-        print(json.dumps(patch), 'exists but is out of date')
-        sys.exit(1)
-  else:
-    with open(patch, 'w') as f:
-      f.write(diff)
-  # remove target now diff exists
-  os.remove(target)
-
-print(patches)
-with open('patches.sh', 'w') as f:
-  print(' '.join(['vi'] + patches), file=f)
+  pairs = []
+  for target in glob.glob('test/fixtures/*/*.*'):
+    # packed sources are read through the store
+    if target.endswith(MANIFEST): continue
+    ext = get_ext(target)
+    if ext.startswith('juris-m.'):
+      source = target[:-len(ext)] + ext.replace('juris-m.', '')
+    elif ext.startswith('jurism.'):
+      source = target[:-len(ext)] + ext.replace('jurism.', '')
+    else:
+      continue
+    pairs.append((source, target, ext))
+
+  patches = []
+  with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+    diffs = pool.map(diff, *zip(*pairs), [args.full] * len(pairs)) if pairs else []
+    for (source, target, ext), _diff in zip(pairs, diffs):
+      print(target)
+      patch = source + '.jurism.patch'
+      patches.append(shlex.quote(patch))
+
+      if os.path.exists(patch):
+        with open(patch) as f:
+          if f.read() != _diff:
+            print(json.dumps(patch), 'exists but is out of date')
+            sys.exit(1)
+      else:
+        with open(patch, 'w') as f:
+          f.write(_diff)
+      # remove target now diff exists
+      os.remove(target)
+
+  print(patches)
+  with open('patches.sh', 'w') as f:
+    print(' '.join(['vi'] + patches), file=f)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import argparse
+import glob
+import json
+import os
+from munch import Munch
+
+parser = argparse.ArgumentParser(description='rank the costs recorded by `test/behave --profile`')
+parser.add_argument('--top', type=int, default=15)
+parser.add_argument('profiles', nargs='+')
+args = parser.parse_args()
+
+scenarios = []
+for profile in args.profiles:
+  for trace in sorted(glob.glob(os.path.join(profile, '*.json'))):
+    with open(trace) as f:
+      scenarios.append(Munch.fromDict(json.load(f)))
+if not scenarios:
+  print('no profiles found')
+  raise SystemExit(1)
+
+def tally(rows):
+  # name => n, total, max and the server/network split where recorded
+  tallied = {}
+  for name, secs, extra in rows:
+    t = tallied.setdefault(name, Munch(n=0, secs=0, max=0, server=0, network=0, cached=0))
+    t.n += 1
+    t.secs += secs
+    t.max = max(t.max, secs)
+    for k in ['server', 'network', 'cached']:
+      t[k] += extra.get(k, 0)
+  return sorted(tallied.items(), key=lambda kv: -kv[1].secs)
+
+def table(title, rows, columns):
+  print(f'\n{title}')
+  for name, t in rows[:args.top]:
+    print('  ' + ' '.join(column(t) for column in columns) + f'  {name}')
+
+total = sum(scenario.duration for scenario in scenarios)
+print(f'{len(scenarios)} scenarios, {total:.1f}s')
+
+kinds = tally(((event.kind, event.secs, event) for scenario in scenarios for event in scenario.events))
+kinds += tally((('step', step.secs, {}) for scenario in scenarios for step in scenario.steps))
+table('time per kind (n, secs, % of suite)', sorted(kinds, key=lambda kv: -kv[1].secs), [
+  lambda t: f'{t.n:6d}',
+  lambda t: f'{t.secs:9.1f}s',
+  lambda t: f'{100 * t.secs / total:5.1f}%' if total else '',
+])
+
+table('slowest scenarios', sorted(((scenario.name, Munch(secs=scenario.duration, restarts=len([e for e in scenario.events if e.kind == 'start']))) for scenario in scenarios), key=lambda kv: -kv[1].secs), [
+  lambda t: f'{t.secs:8.1f}s',
+  lambda t: f'{t.restarts} restarts' if t.restarts else ' ' * 10,
+])
+
+table('slowest steps (n, total, max)', tally(((step.name, step.secs, {}) for scenario in scenarios for step in scenario.steps)), [
+  lambda t: f'{t.n:5d}',
+  lambda t: f'{t.secs:8.1f}s',
+  lambda t: f'{t.max:7.1f}s',
+])
+
+table('bridge calls (n, total, server, network)', tally(((event.name, event.secs, event) for scenario in scenarios for event in scenario.events if event.kind == 'execute')), [
+  lambda t: f'{t.n:5d}',
+  lambda t: f'{t.secs:8.1f}s',
+  lambda t: f'{t.server:8.1f}s',
+  lambda t: f'{t.network:7.1f}s',
+])
+
+table('fixtures (n, total, max, cache hits)', tally(((event.name, event.secs, event) for scenario in scenarios for event in scenario.events if event.kind == 'fixture')), [
+  lambda t: f'{t.n:5d}',
+  lambda t: f'{t.secs:7.2f}s',
+  lambda t: f'{t.max:6.2f}s',
+  lambda t: f'{t.cached:5d}',
+])
+
+table('comparisons (n, total, max)', tally(((event.name, event.secs, event) for scenario in scenarios for event in scenario.events if event.kind == 'compare')), [
+  lambda t: f'{t.n:5d}',
+  lambda t: f'{t.secs:7.2f}s',
+  lambda t: f'{t.max:6.2f}s',
+])
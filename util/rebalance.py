@@ -5,138 +5,183 @@ import sys
 import json
 from munch import Munch
 import re
-from ortools.algorithms import pywrapknapsack_solver
-
-ref, output = sys.argv[1:]
+import math
+import glob
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'test', 'features'))
+from steps.balance import partition
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--bins', type=int, default=2)
+parser.add_argument('--estimate', default='0.5', help="duration used for balancing: a quantile of the recent samples (0-1), or 'ewma'")
+parser.add_argument('--logs', action='append', default=[], help='additional behave logs to take timings from (glob)')
+parser.add_argument('--history', action='append', default=[], help='balance.json from another branch to merge timings from')
+parser.add_argument('ref')
+parser.add_argument('output')
+args = parser.parse_args()
+if args.estimate != 'ewma': assert 0 < float(args.estimate) <= 1, f'{args.estimate} is not a quantile'
+ref, output = args.ref, args.output
 if not ref.startswith('refs/heads/'):
   print(ref, 'is not a branch')
   sys.exit(0)
 branch = ref.split('/')[-1]
 
-print('rebalance', branch, '=>', output)
+print('rebalance', branch, '=>', output, f'({args.bins} bins)')
 
-for job in [1, 2]:
-  job = f'logs/behave-zotero-{job}-{branch}.json'
+logs = [f'logs/behave-zotero-{job}-{branch}.json' for job in range(1, args.bins + 1)]
+# a run is complete when every job left a log and nothing failed; only complete runs may drop scenarios from the balance
+complete = True
+for job in logs:
   if not os.path.exists(job):
     print('not found:', job)
-    sys.exit(0)
-
-class RunningAverage():
-  def __init__(self, average=None, n=0):
-    self.average = average
-    self.n = n
+    complete = False
+logs = [job for job in logs if os.path.exists(job)]
+for pattern in args.logs:
+  logs += [job for job in sorted(glob.glob(pattern)) if job not in logs]
+if len(logs) == 0:
+  print('no logs')
+  sys.exit(0)
 
-  def add(self, new_value):
-    self.n += 1
-    if self.n == 1:
-      self.average = new_value
+def round10(msecs):
+  return int(round(msecs / 10) * 10)
+
+class Duration():
+  # per-scenario timing record: exponentially weighted moving average plus a window of recent samples for quantiles
+  window = 10
+  alpha = 0.3
+
+  def __init__(self, ewma=None, samples=None, runs=0):
+    self.ewma = ewma
+    self.samples = samples or []
+    self.runs = runs
+
+  @classmethod
+  def load(cls, h, runs):
+    if h is None: return cls()
+    # legacy formats: bare msecs, or msecs with a run count relative to the balance run count
+    if type(h) in (float, int): return cls(h, [h], runs)
+    if 'samples' not in h: return cls(h.msecs, [h.msecs], h.runs + runs)
+    return cls(h.ewma, list(h.samples), h.runs)
+
+  def merge(self, other, seen=0):
+    # only the runs of `other` past the `seen` that were merged before; fewer than that means it was reset
+    runs = other.runs - seen if other.runs >= seen else other.runs
+    if runs <= 0: return
+    if self.runs == 0:
+      self.ewma = other.ewma
     else:
-      # https://math.stackexchange.com/questions/106700/incremental-averageing
-      self.average = self.average + ((new_value - self.average) / self.n)
-
-  def __float__(self):
-    return self.average
-
-  def __repr__(self):
-    return "average: " + str(self.average)
-
-class NoTestError(Exception):
-  pass
-class FailedError(Exception):
-  pass
+      self.ewma = (self.ewma * self.runs + other.ewma * runs) / (self.runs + runs)
+    self.samples = (self.samples + other.samples[-runs:])[-self.window:]
+    self.runs += runs
+
+  def add(self, msecs):
+    self.runs += 1
+    self.ewma = msecs if self.ewma is None else self.alpha * msecs + (1 - self.alpha) * self.ewma
+    self.samples = (self.samples + [msecs])[-self.window:]
+
+  def quantile(self, q):
+    samples = sorted(self.samples)
+    # nearest-rank
+    return samples[max(0, math.ceil(q * len(samples)) - 1)]
+
+  def dump(self, estimate):
+    return Munch(
+      msecs=round10(self.ewma if estimate == 'ewma' else self.quantile(float(estimate))),
+      ewma=round10(self.ewma),
+      p50=round10(self.quantile(0.5)),
+      p90=round10(self.quantile(0.9)),
+      samples=[round10(sample) for sample in self.samples],
+      runs=self.runs,
+    )
 
 class Log:
   def __init__(self):
-    self.tests = []
+    self.tests = {}
+    self.failed = set()
 
   def load(self, timings):
-    tests = {}
-
     for feature in timings:
       if not 'elements' in feature: continue
 
       for test in feature.elements:
         if test.type == 'background': continue
-
-        if test.status == 'failed':
-          status = test.status
-        elif not 'use.with_slow=true' in test.tags and not 'slow' in test.tags:
-          status = 'fast'
-        else:
-          status = 'slow'
+        name = re.sub(r' -- @[0-9]+\.[0-9]+ ', '', test.name)
 
         # for retries, the last successful iteration (if any) will overwrite the failed iterations
-        tests[re.sub(r' -- @[0-9]+\.[0-9]+ ', '', test.name)] = Munch(
+        if test.status == 'failed':
+          self.failed.add(name)
+          self.tests.pop(name, None)
+          continue
+        if test.status != 'passed': continue
+        self.failed.discard(name)
+
+        self.tests[name] = Munch(
+          name=name,
           # convert to msecs here or too much gets rounded down to 0
           msecs=sum([step.result.duration * 1000 for step in test.steps if 'result' in step and 'duration' in step.result]), # msecs
-          status=status
+          status='fast' if not 'use.with_slow=true' in test.tags and not 'slow' in test.tags else 'slow'
         )
-    if len(tests) == 0: raise NoTestError()
-    if any(1 for test in tests.values() if test.status == 'failed'): raise FailedError()
 
-    for name, test in tests.items():
-      self.tests.append(Munch(name=name, msecs=test.msecs, status=status))
+def load_balance(path):
+  with open(path) as f:
+    balance = json.load(f, object_hook=Munch.fromDict)
+  durations = { name: Duration.load(h, balance.runs) for name, h in balance.duration.items() }
+  return balance, durations
 
 log = Log()
-try:
-  for job in [1, 2]:
-    with open(f'logs/behave-zotero-{job}-{branch}.json') as f:
+for job in logs:
+  try:
+    with open(job) as f:
       log.load(json.load(f, object_hook=Munch.fromDict))
-  print(len(log.tests), 'tests')
-
-  with open(output) as f:
-    history = json.load(f, object_hook=Munch.fromDict)
-  for name, h in list(history.duration.items()):
-    if type(h) in (float, int):
-      history.duration[name] = Munch(msecs=h, runs=0)
-    history.duration[name].runs += history.runs
-
-  balance = Munch.fromDict({
-    'duration': {},
-    'runs': history.runs + 1,
-  })
-
-  for test in log.tests:
-    if h:= history.duration.get(test.name):
-      avg = RunningAverage(h.msecs, h.runs)
-    else:
-      avg = RunningAverage()
-    avg.add(test.msecs)
-    balance.duration[test.name] = Munch(msecs=round(float(avg) / 10) * 10, runs=avg.n)
-
-  for status in ['slow', 'fast']:
-    tests = [test for test in log.tests if status in [ 'slow', test.status] ]
-    durations = [balance.duration[test.name].msecs for test in tests]
-
-    #if status == 'slow':
-    #  solver = pywrapknapsack_solver.KnapsackSolver.KNAPSACK_MULTIDIMENSION_BRANCH_AND_BOUND_SOLVER
-    #else:
-    #  solver = pywrapknapsack_solver.KnapsackSolver.KNAPSACK_MULTIDIMENSION_CBC_MIP_SOLVER
-    solver = pywrapknapsack_solver.KnapsackSolver.KNAPSACK_MULTIDIMENSION_CBC_MIP_SOLVER
-    solver = pywrapknapsack_solver.KnapsackSolver(solver, 'TestBalancer')
-    solver.Init([1 for n in durations], [durations], [int(sum(durations)/2)])
-    solver.Solve()
-
-    balance[status] = {}
-    for _bin in [1, 2]:
-      balance[status][_bin] = [ test.name for i, test in enumerate(tests) if solver.BestSolutionContains(i) == (_bin == 1) ]
-    print(status, len(tests), 'tests,', { k: len(t) for k, t in balance[status].items()})
-
-  # simplify for cleaner diffs
-  for name, duration in list(balance.duration.items()):
-    balance.duration[name].runs -= balance.runs
-    if balance.duration[name].runs == 0:
-      balance.duration[name] = balance.duration[name].msecs
-
-except FileNotFoundError:
-  print('logs incomplete')
-  sys.exit()
-except NoTestError:
+    print('loaded', job)
+  except (FileNotFoundError, json.JSONDecodeError) as err:
+    # a job that was cancelled mid-run may leave a truncated log
+    print('skipping', job, err)
+    complete = False
+print(len(log.tests), 'passed,', len(log.failed), 'failed')
+if len(log.tests) == 0:
   print('missing tests')
   sys.exit()
-except FailedError:
-  print('some tests failed')
-  sys.exit()
+if len(log.failed) > 0: complete = False
+
+history, durations = load_balance(output)
+# per history file, the runs of each scenario merged so far, so merging the same history again adds nothing
+merged = history.get('merged', Munch())
+for path in args.history:
+  # timings recorded on other branches
+  _, other = load_balance(path)
+  seen = merged.setdefault(os.path.normpath(path), Munch())
+  for name, duration in other.items():
+    durations.setdefault(name, Duration()).merge(duration, seen.get(name, 0))
+    seen[name] = duration.runs
+
+for test in log.tests.values():
+  durations.setdefault(test.name, Duration()).add(test.msecs)
+
+# scenarios that did not run or failed keep their timings and their slow/fast classification from earlier runs
+recorded = { status: set(name for names in history.get(status, []) for name in names) for status in ['slow', 'fast'] }
+seen = set(log.tests.keys())
+fast = set(name for name, test in log.tests.items() if test.status == 'fast')
+if complete:
+  print('complete run, dropping scenarios that did not run')
+  tests = { 'slow': seen, 'fast': fast }
+else:
+  tests = { 'slow': recorded['slow'] | seen, 'fast': (recorded['fast'] - seen) | fast }
+
+balance = Munch.fromDict({
+  'duration': { name: durations[name].dump(args.estimate) for name in tests['slow'] if name in durations and durations[name].runs > 0 },
+  'runs': history.runs + 1,
+  'estimate': args.estimate,
+})
+if merged:
+  balance.merged = { path: { name: runs for name, runs in seen.items() if name in balance.duration } for path, seen in merged.items() }
+
+for status in ['slow', 'fast']:
+  names = [name for name in tests[status] if name in balance.duration]
+  balance[status] = partition({ name: balance.duration[name].msecs for name in names }, args.bins)
+  loads = [sum(balance.duration[name].msecs for name in _bin) for _bin in balance[status]]
+  print(status, len(names), 'tests,', [len(_bin) for _bin in balance[status]], 'msecs:', loads)
 
 print('writing', output)
 with open(output, 'w') as f:
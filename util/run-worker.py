@@ -1,56 +1,170 @@
 #!/usr/bin/env python3
 
+# Runs the export worker and a translator under node, outside Zotero, and reports throughput, per-phase timing and
+# peak heap for one or more fixtures. Needs a build (`npm run build`) but no network and no Zotero.
+
+import argparse
 import json
 import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+def setting(value):
+  name, value = value.split('=', 1)
+  try:
+    return name, json.loads(value)
+  except json.JSONDecodeError:
+    return name, value
+
+parser = argparse.ArgumentParser(description='benchmark a translator in the export worker under node')
+parser.add_argument('-t', '--translator', default='Better BibLaTeX')
+parser.add_argument('-p', '--pref', type=setting, action='append', default=[], help='preference override, name=value')
+parser.add_argument('-o', '--option', type=setting, action='append', default=[], help='export option, name=value')
+parser.add_argument('-n', '--iterations', type=int, default=5)
+parser.add_argument('-w', '--warmup', type=int, default=1)
+parser.add_argument('-c', '--chunks', default='all', help='comma-separated item counts to export, "all" for the whole fixture')
+parser.add_argument('--client', default='zotero', choices=['zotero', 'jurism'])
+parser.add_argument('--output', help='write the output of the last run here')
+parser.add_argument('--report', help='write the measurements as JSON here')
+parser.add_argument('fixtures', nargs='*', default=['test/fixtures/export/Bulk performance test.json'])
+args = parser.parse_args()
+
+WORKER = os.path.join(ROOT, 'build/content/worker/zotero.js')
+TRANSLATOR = os.path.join(ROOT, 'build/resource', f'{args.translator}.js')
+for path in [WORKER, TRANSLATOR, os.path.join(ROOT, 'gen/preferences/defaults.json')]:
+  if not os.path.exists(path):
+    print(f'{os.path.relpath(path, ROOT)} not found, run `npm run build` first')
+    sys.exit(1)
+
+HARNESS = r'''
+const fs = require('fs')
+const vm = require('vm')
+const job = JSON.parse(fs.readFileSync(process.argv[2], 'utf-8'))
+
+globalThis.self = globalThis
+globalThis.ZOTERO_CONFIG = { GUID: `${job.client}@chnm.gmu.edu` }
+globalThis.dump = msg => process.stderr.write(msg)
+
+const phases = {}
+function timed(phase, f) {
+  const started = process.hrtime.bigint()
+  try {
+    return f()
+  }
+  finally {
+    phases[phase] = (phases[phase] || 0) + Number(process.hrtime.bigint() - started) / 1e6
+  }
+}
+
+let heap = 0
+function sampleHeap() {
+  heap = Math.max(heap, process.memoryUsage().heapUsed)
+}
+
+globalThis.importScripts = function(url) {
+  // the worker only imports the translator itself; the Zotero modules it asks for are not needed outside Zotero
+  if (!url.startsWith('resource://zotero-better-bibtex/')) return
+  timed('load', () => vm.runInThisContext(fs.readFileSync(job.translator, 'utf-8'), { filename: job.translator }))
+}
+
+let output = null
+globalThis.postMessage = function(msg) {
+  switch (msg.kind) {
+    case 'done':
+      output = msg.output
+      break
+    case 'error':
+      console.error(msg.message)
+      process.exit(1)
+    case 'item':
+      if (msg.item % 100 === 0) sampleHeap()
+      break
+    case 'debug':
+      if (job.debug) console.error(msg.message)
+      break
+  }
+}
+
+vm.runInThisContext(fs.readFileSync(job.worker, 'utf-8'), { filename: job.worker })
+onmessage({ data: { kind: 'configure', environment: { version: '5.0.0', platform: 'lin', locale: 'en-US' } } })
+
+const data = JSON.parse(fs.readFileSync(job.fixture, 'utf-8'))
+const preferences = { ...JSON.parse(fs.readFileSync(job.defaults, 'utf-8')), ...(data.config?.preferences || {}), ...job.preferences }
+const options = { ...(data.config?.options || {}), ...job.options }
+const collections = Object.values(data.collections || {})
+
+const results = []
+for (const chunk of job.chunks) {
+  const items = chunk === 'all' ? data.items : data.items.slice(0, chunk)
+  const config = new TextEncoder().encode(JSON.stringify({
+    translator: job.label,
+    preferences,
+    options,
+    output: '',
+    debugEnabled: !!job.debug,
+    job: 1,
+    data: { items, collections, cache: {} },
+  }))
+
+  const runs = []
+  for (let i = 0; i < job.warmup + job.iterations; i++) {
+    if (global.gc) global.gc()
+    for (const phase of Object.keys(phases)) delete phases[phase]
+    heap = 0
+    output = null
+    timed('total', () => onmessage({ data: { kind: 'start', config } }))
+    sampleHeap()
+    if (output === null) throw new Error('worker did not finish')
+    if (i >= job.warmup) runs.push({ ...phases, export: phases.total - (phases.load || 0), heap: heap / (1024 * 1024), bytes: output.length })
+  }
+  results.push({ items: items.length, runs })
+  if (job.output) fs.writeFileSync(job.output, output)
+}
+console.log(JSON.stringify(results))
+'''
+
+def median(runs, key):
+  return statistics.median(run.get(key, 0) for run in runs)
+
+report = []
+with tempfile.TemporaryDirectory() as tmp:
+  harness = os.path.join(tmp, 'harness.js')
+  with open(harness, 'w') as f:
+    f.write(HARNESS)
+
+  for fixture in args.fixtures:
+    job = os.path.join(tmp, 'job.json')
+    with open(job, 'w') as f:
+      json.dump({
+        'worker': WORKER,
+        'translator': TRANSLATOR,
+        'label': args.translator,
+        'client': args.client,
+        'defaults': os.path.join(ROOT, 'gen/preferences/defaults.json'),
+        'fixture': os.path.abspath(fixture),
+        'preferences': dict(args.pref),
+        'options': dict(args.option),
+        'chunks': [chunk if chunk == 'all' else int(chunk) for chunk in args.chunks.split(',')],
+        'iterations': args.iterations,
+        'warmup': args.warmup,
+        'output': args.output and os.path.abspath(args.output),
+      }, f)
+
+    node = subprocess.run(['node', '--expose-gc', harness, job], stdout=subprocess.PIPE, encoding='utf-8')
+    if node.returncode != 0: sys.exit(node.returncode)
+
+    print(f'{args.translator}: {os.path.basename(fixture)}')
+    print(f'  {"items":>7} {"total":>9} {"load":>8} {"export":>9} {"items/s":>9} {"heap":>8}')
+    for result in json.loads(node.stdout):
+      runs = result['runs']
+      total = median(runs, 'total')
+      print(f'  {result["items"]:7d} {total:7.0f}ms {median(runs, "load"):6.0f}ms {median(runs, "export"):7.0f}ms {result["items"] / (total / 1000) if total else 0:9.0f} {max(run["heap"] for run in runs):6.0f}MB')
+      report.append({ 'translator': args.translator, 'fixture': fixture, **result })
 
-translator = 'Better BibLaTeX'
-data = "./test/fixtures/export/Really Big whopping library.json"
-
-with open('tr.js', 'w') as tr:
-  print(f'''
-    const fs = require('fs')
-
-    const self = {{ eval }}
-
-    self.location = {{ search: "?client=zotero&version=5.0.80&platform=mac&translator={translator.replace(' ', '%20')}" }}
-  ''', file = tr)
-
-  with open('build/resource/worker/Zotero.js') as zotero:
-    for line in zotero:
-      if line.startswith('ctx.importScripts'): continue
-      print(line, file=tr)
-
-  with open(f'build/resource/{translator}.js') as f:
-    print(f.read(), file=tr)
-
-  print(f'''
-    const data = require({json.dumps(data)})
-    const preferences = require('./gen/preferences/defaults.json')
-
-    self.postMessage = function(msg) {{
-      switch (msg.kind) {{
-        case 'debug':
-          console.log(msg.message)
-          break
-        case 'error':
-          console.log(msg.message)
-          console.log(msg.stack)
-          break
-        case 'export':
-          console.log(msg.output)
-          break
-        default:
-          console.log(msg)
-      }}
-    }}
-
-    onmessage({{
-      data: {{
-        preferences: Object.assign(preferences, data.config.preferences),
-        options: data.config.options,
-        items: data.items,
-      }}
-    }})
-  ''', file=tr)
-
-os.system('node tr.js')
+if args.report:
+  with open(args.report, 'w') as f:
+    json.dump(report, f, indent='  ')
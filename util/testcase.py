@@ -21,6 +21,8 @@ from github import Github
 #from pathlib import Path
 import shutil
 #import string
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
 from pygit2 import Repository
 from gherkin.parser import Parser
@@ -33,14 +35,29 @@ try:
 except ValueError:
   issue = None
 
+ISSUES = os.path.join(root, '.github/issues.json')
+
+TRANSLATORS = {
+  'biblatex': 'BibLaTeX',
+  'bibtex': 'BibTeX',
+  'csl': 'CSL-JSON',
+  'csl-json': 'CSL-JSON',
+  'yml': 'CSL-YAML',
+  'csl-yaml': 'CSL-YAML',
+}
+
 # get arguments
 parser = argparse.ArgumentParser()
 parser.add_argument('--translator', '-t', dest='translator', default='biblatex')
-parser.add_argument('--data',       '-d', dest='data', required=True)
+parser.add_argument('--data',       '-d', dest='data')
 parser.add_argument('--feature',    '-f', dest='feature')
 parser.add_argument('--issue',      '-i', dest='issue', default=issue and str(issue))
 parser.add_argument('--export',     '-e', dest='mode', action='store_const', const='export')
 parser.add_argument('--import'          , dest='mode', action='store_const', const='import')
+parser.add_argument('--case',       '-c', dest='cases', action='append', default=[], help='issue,data[,translator]; may be repeated')
+parser.add_argument('--batch',      '-b', dest='batch', help='file with one "issue data [translator]" per line')
+parser.add_argument('--jobs',       '-j', dest='jobs', type=int, default=os.cpu_count())
+parser.add_argument('--offline'         , dest='offline', action='store_true', help='only take issue titles from .github/issues.json')
 args, unknownargs = parser.parse_known_args()
 sys.argv = sys.argv[:1] + unknownargs
 
@@ -51,73 +68,94 @@ if not args.feature:
   args.feature = os.path.join(root, 'test', 'features', f'{args.mode}.feature')
 assert os.path.exists(args.feature),  f'{args.feature} does not exist'
 
-args.translator = {
-  'biblatex': 'BibLaTeX',
-  'bibtex': 'BibTeX',
-  'csl': 'CSL-JSON',
-  'csl-json': 'CSL-JSON',
-  'yml': 'CSL-YAML',
-  'csl-yaml': 'CSL-YAML',
-}[args.translator.lower()]
-
-assert args.issue, 'no issue'
-args.data = os.path.join(root, 'logs', f'{args.data}/items.json')
-assert os.path.exists(args.data),  f'{args.data} does not exist'
-
-# get title
-
-g = Github(os.environ['GITHUB_TOKEN'])
-repo = g.get_repo('retorquere/zotero-better-bibtex')
-issue = repo.get_issue(int(args.issue))
-args.title = sanitize_filename(f'{issue.title} #{issue.number}'.strip())
-
-# clean lib before putting it in place
-assert call(["./util/clean-lib.ts", args.data, '--save'], cwd=root) == 0, 'clean failed'
-with open(args.data) as f:
-  args.n = len(json.load(f)['items'])
-
-# insert example
+def testcase(issue, data, translator=None):
+  assert issue, 'no issue'
+  data = os.path.join(root, 'logs', f'{data}/items.json')
+  assert os.path.exists(data),  f'{data} does not exist'
+  return Munch(issue=str(int(issue)), data=data, translator=TRANSLATORS[(translator or args.translator).lower()])
+
+tests = [testcase(*case.split(',')) for case in args.cases]
+if args.batch:
+  with open(args.batch) as f:
+    tests += [testcase(*line.split()) for line in f.read().split('\n') if line.strip() and not line.startswith('#')]
+if not tests:
+  assert args.data, 'no data'
+  tests = [testcase(args.issue, args.data)]
+
+# get titles, from the issue list util/changelog.py maintains where possible. Titles fetched here are not added to it,
+# as changelog.py stops fetching at the first issue it already knows
+try:
+  with open(ISSUES) as f:
+    titles = json.load(f)
+except FileNotFoundError:
+  titles = {}
+if missing := sorted(set(test.issue for test in tests if test.issue not in titles), key=int):
+  assert not args.offline, f'no title for {", ".join(missing)} in {os.path.relpath(ISSUES, root)}'
+  repo = Github(os.environ['GITHUB_TOKEN']).get_repo('retorquere/zotero-better-bibtex')
+  for nr in missing:
+    titles[nr] = repo.get_issue(int(nr)).title
+for test in tests:
+  test.title = sanitize_filename(f'{titles[test.issue]} #{test.issue}'.strip())
+duplicates = [title for title, n in Counter(test.title for test in tests).items() if n > 1]
+assert not duplicates, f'more than one test case for {", ".join(duplicates)}'
+
+# clean libs before putting them in place
+def clean(test):
+  assert call(["./util/clean-lib.ts", test.data, '--save'], cwd=root) == 0, f'clean of {test.data} failed'
+  with open(test.data) as f:
+    return len(json.load(f)['items'])
+with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+  for test, n in zip(tests, pool.map(clean, tests)):
+    test.n = n
+
+# insert examples
 parser = Parser()
 doc = Munch.fromDict(parser.parse(args.feature))
 
-outlines = [child for child in doc.feature.children if child.type == 'ScenarioOutline' and (args.translator in child.name or args.mode == 'import')]
-assert len(outlines) == 1, f'{len(outlines)} outlines found containing {args.translator}'
-
 with open(args.feature) as f:
   contents = f.readlines()
-  example = [f'| {args.title} | {args.n} |\n']
-
-examples = [example for example in outlines[0].examples[0].tableBody if example.cells[0].value == args.title]
-match len(examples):
-  case 0:
-    # insert as first
-    line = outlines[0].examples[0].tableHeader.location.line
-    contents = contents[:line] + example + contents[line:]
-
-  case 1:
-    if examples[0].cells[1].value == str(args.n):
-      contents = None
-    else:
-      # replace
-      line = examples[0].location.line
-      contents = contents[:line - 1] + example + contents[line:]
-  case _:
-    assert False, f'{len(examples)} examples found with title {json.dumps(args.title)}'
-
-if contents:
+
+inserts = {}
+changed = False
+for test in tests:
+  outlines = [child for child in doc.feature.children if child.type == 'ScenarioOutline' and (test.translator in child.name or args.mode == 'import')]
+  assert len(outlines) == 1, f'{len(outlines)} outlines found containing {test.translator}'
+
+  example = f'| {test.title} | {test.n} |\n'
+  examples = [example for example in outlines[0].examples[0].tableBody if example.cells[0].value == test.title]
+  match len(examples):
+    case 0:
+      # insert as first
+      inserts.setdefault(outlines[0].examples[0].tableHeader.location.line, []).append(example)
+      changed = True
+
+    case 1:
+      if examples[0].cells[1].value != str(test.n):
+        # replace
+        contents[examples[0].location.line - 1] = example
+        changed = True
+    case _:
+      assert False, f'{len(examples)} examples found with title {json.dumps(test.title)}'
+
+# bottom up, so the line numbers from the parse stay valid
+for line in sorted(inserts, reverse=True):
+  contents = contents[:line] + inserts[line] + contents[line:]
+
+if changed:
   with open(args.feature, 'w') as f:
     f.write(''.join(contents))
 
 # copy/create test fixtures
-fixture = os.path.join(root, f'test/fixtures/{args.mode}', args.title)
-shutil.copyfile(args.data, fixture + '.json')
-if args.mode == 'import':
-  ext = 'bib'
-else:
-  ext = args.translator.lower().replace('-', '.').replace('yaml', 'yml')
-with open(fixture + '.' + ext, 'w') as f:
-  if args.translator == 'CSL-JSON':
-    f.write('{}')
+for test in tests:
+  fixture = os.path.join(root, f'test/fixtures/{args.mode}', test.title)
+  shutil.copyfile(test.data, fixture + '.json')
+  if args.mode == 'import':
+    ext = 'bib'
+  else:
+    ext = test.translator.lower().replace('-', '.').replace('yaml', 'yml')
+  with open(fixture + '.' + ext, 'w') as f:
+    if test.translator == 'CSL-JSON':
+      f.write('{}')
 
 # reformat
 sys.argv.append(args.feature)
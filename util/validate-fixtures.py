@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+
+# Validates every BBT JSON fixture, with its client patch applied, the way Zotero.load would: against bbtjsonschema,
+# and its items against the per-client validity table in gen/items/<client>.schema when that has been built. Runs in
+# a process pool and remembers files that passed by content hash, so a broken fixture fails in seconds instead of
+# mid-run.
+
+import os
+import sys
+import json
+import time
+import glob
+import hashlib
+import argparse
+import jsonpatch
+import jsonschema
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT, 'test', 'features'))
+from steps.bbtjsonschema import schema as bbtjsonschema
+from steps.store import store, manifests, MANIFEST
+from steps.cache import CACHE
+
+FIXTURES = os.path.join(ROOT, 'test/fixtures')
+RESULTS = os.path.join(CACHE, 'validate-fixtures.json')
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--client', choices=['zotero', 'jurism'], action='append', help='default: both')
+parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count())
+parser.add_argument('--slowest', type=int, default=10, help='report the N slowest fixtures')
+parser.add_argument('--no-cache', dest='cache', action='store_false')
+parser.add_argument('--strict', action='store_true', help='fail on validity table problems too')
+parser.add_argument('fixtures', nargs='*', help='default: every BBT JSON fixture')
+
+def table(client):
+  return os.path.join(ROOT, 'gen/items', f'{client}.schema')
+
+tables = {}
+validators = {}
+def validator(name, itemType=None):
+  # compiled once per schema per worker; the validity table is split per item type, which is what its discriminator
+  # would select anyway
+  if (name, itemType) not in validators:
+    if name == 'bbt':
+      schema = bbtjsonschema
+    else:
+      if name not in tables:
+        with open(table(name)) as f:
+          tables[name] = json.load(f)
+      schema = next((schema for schema in tables[name]['oneOf'] if schema['properties']['itemType']['const'] == itemType), None)
+      if schema: schema = { **schema, '$defs': tables[name]['$defs'] }
+    validators[(name, itemType)] = schema and jsonschema.validators.validator_for(schema)(schema)
+  return validators[(name, itemType)]
+
+def serialized(item):
+  # the validity table describes items as Zotero serializes them, not as BBT JSON exports them
+  item = { k: v for k, v in item.items() if k not in ['citationKey', 'key', 'uri', 'relations', 'collections'] }
+  if type(item.get('extra')) == list: item['extra'] = '\n'.join(item['extra'])
+  if 'creators' in item:
+    item['creators'] = [
+      { **{ k: v for k, v in creator.items() if k != 'name' }, 'lastName': creator['name'], 'fieldMode': 1 } if 'name' in creator else creator
+      for creator in item['creators']
+    ]
+  if 'attachments' in item:
+    item['attachments'] = [{ k: v for k, v in att.items() if k != 'tags' } for att in item['attachments']]
+  return item
+
+def problem(error, path):
+  where = '/'.join(str(p) for p in error.absolute_path)
+  return f'{path}{where and " at " + where}: {error.message[:300]}'
+
+def validate(path, patch, client, strict):
+  # schema errors would fail Zotero.load; validity table problems are warnings unless --strict
+  started = time.time()
+  warnings = []
+  try:
+    if store.packed(path):
+      data = store.load(path)
+    else:
+      with open(path) as f:
+        data = json.load(f)
+    if patch:
+      with open(patch) as f:
+        data = jsonpatch.JsonPatch(json.load(f)).apply(data)
+
+    errors = [problem(error, 'library') for error in validator('bbt').iter_errors(data)]
+    if not errors and os.path.exists(table(client)):
+      for i, item in enumerate(data['items']):
+        if not (valid := validator(client, item['itemType'])):
+          warnings.append(f'items/{i}: {item["itemType"]} is not a {client} item type')
+        else:
+          warnings += [problem(error, f'items/{i} ({item["itemType"]})') for error in valid.iter_errors(serialized(item))]
+  except Exception as err:
+    errors = [f'{type(err).__name__}: {err}']
+  if strict: errors, warnings = errors + warnings, []
+  return errors, warnings, time.time() - started
+
+def fixtures(named):
+  if named:
+    for fixture in named:
+      fixture = os.path.abspath(fixture)
+      yield fixture[:-len(MANIFEST)] if fixture.endswith(MANIFEST) else fixture
+    return
+
+  for fixture in sorted(glob.glob(os.path.join(FIXTURES, '*', '*.json')) + [manifest[:-len(MANIFEST)] for manifest in manifests()]):
+    if os.path.basename(os.path.dirname(fixture)) not in ['export', 'import', 'merge']: continue
+    if fixture.endswith('.csl.json') or fixture.endswith('.schomd.json'): continue
+    yield fixture
+
+def fingerprint(*paths):
+  h = hashlib.sha1()
+  for path in paths:
+    if path and store.packed(path):
+      # a manifest refers to its items by hash already
+      path += MANIFEST
+    if path:
+      with open(path, 'rb') as f:
+        h.update(f.read())
+    h.update(b'\0')
+  return h.hexdigest()
+
+def main():
+  args = parser.parse_args()
+  clients = args.client or ['zotero', 'jurism']
+
+  schemas = hashlib.sha1(json.dumps(bbtjsonschema, sort_keys=True).encode('utf-8'))
+  for client in ['zotero', 'jurism']:
+    if os.path.exists(table(client)):
+      with open(table(client), 'rb') as f:
+        schemas.update(f.read())
+    elif client in clients:
+      print(f'{os.path.relpath(table(client), ROOT)} not found, validating against bbtjsonschema only')
+  schemas = schemas.hexdigest()
+
+  results = {}
+  if args.cache and os.path.exists(RESULTS):
+    with open(RESULTS) as f:
+      results = json.load(f)
+
+  jobs = []
+  seen = set()
+  skipped = 0
+  warned = 0
+  for fixture in fixtures(args.fixtures):
+    for client in clients:
+      patch = f'{fixture}.{client}.patch'
+      if not os.path.exists(patch): patch = None
+      # without a patch or a validity table, both clients see the same thing
+      name = os.path.relpath(fixture, FIXTURES) + (f' ({client})' if patch or os.path.exists(table(client)) else '')
+      if name in seen: continue
+      seen.add(name)
+      key = fingerprint(fixture, patch) + schemas + str(args.strict)
+      if results.get(name, {}).get('key') == key:
+        skipped += 1
+        warned += results[name]['warnings']
+      else:
+        jobs.append((name, key, fixture, patch, client))
+
+  started = time.time()
+  failed = {}
+  warnings = {}
+  timings = []
+  with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+    for (name, key, fixture, patch, client), (errors, _warnings, secs) in zip(jobs, pool.map(validate, *[[job[i] for job in jobs] for i in [2, 3, 4]], [args.strict] * len(jobs))):
+      timings.append((secs, name))
+      if errors:
+        failed[name] = errors
+        results.pop(name, None)
+      else:
+        results[name] = { 'key': key, 'warnings': len(_warnings) }
+      if _warnings: warnings[name] = _warnings
+
+  if args.cache:
+    os.makedirs(os.path.dirname(RESULTS), exist_ok=True)
+    with open(RESULTS, 'w') as f:
+      json.dump(results, f, indent='  ', sort_keys=True)
+
+  for label, problems in [('warning', warnings), ('FAILED', failed)]:
+    for name, errors in sorted(problems.items()):
+      print(f'{label} {name}')
+      for error in errors[:5]:
+        print(f'  {error}')
+      if len(errors) > 5: print(f'  ... and {len(errors) - 5} more')
+
+  if timings and args.slowest:
+    print('slowest:')
+    for secs, name in sorted(timings, reverse=True)[:args.slowest]:
+      print(f'  {secs:6.2f}s {name}')
+
+  warned += sum(len(_warnings) for _warnings in warnings.values())
+  print(f'{len(jobs)} validated, {skipped} unchanged, {len(failed)} failed, {warned} warnings in {time.time() - started:.1f}s')
+  sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+  main()